@@ -0,0 +1,69 @@
+'''
+Regression & benchmark checks of the Wiki text Cleaner on pathological pages.
+Each case is run at 2 sizes; the time ratio should stay close to the size ratio (linear behaviour).
+
+USAGE:
+$ <script.py> [size_in_MB]
+
+EXAMPLE:
+$ python misc/benchmark_cleaner.py 5
+'''
+
+import sys
+from time import time
+
+from utils.wiki_dump_reader import Cleaner
+
+PARAGRAPH = "'''भारत''' [[दक्षिण एशिया]] में स्थित [[देश|राष्ट्र]] है।{{cite web|url=x}} [[File:Flag.png|thumb|[[तिरंगा]]]]\n\n"
+
+# Name -> function which generates a page of approximately the given no. of chars
+PATHOLOGICAL_PAGES = {
+    'regular_article': lambda n: PARAGRAPH * (n // len(PARAGRAPH)),
+    'deep_templates': lambda n: '{{' * (n // 4) + '}}' * (n // 4),
+    'deep_links': lambda n: '[[' * (n // 4) + ']]' * (n // 4),
+    'unterminated_templates': lambda n: 'क {{' * (n // 4),
+    'unterminated_links': lambda n: 'क [[' * (n // 4),
+    'unterminated_file_links': lambda n: '[[File:' * (n // 7),
+    'unbalanced_closings': lambda n: 'क]]}}' * (n // 5),
+}
+
+# Expected outputs of the cleaner on small malformed pages
+REGRESSION_CASES = [
+    ('_remove_templates', 'a {{b|c}} d', 'a  d'),
+    ('_remove_templates', 'a {{link-en|b|c}} d', 'a b d'),
+    ('_remove_templates', 'a {{b {{c}} d', 'a '),
+    ('_remove_file_links', 'a [[File:b|[[c]]]] d', 'a  d'),
+    ('_remove_file_links', 'a [[File:b [[File:c]] d', 'a [[File:b  d'),
+    ('_remove_file_links', 'a [[File:b', 'a [[File:b'),
+    ('build_links', ' a [[b|c]] [[d]] [[e', ('a c d', [
+        {'begin': 2, 'end': 3, 'link': 'b', 'text': 'c'},
+        {'begin': 4, 'end': 5, 'link': 'd', 'text': 'd'},
+    ])),
+]
+
+def clean(cleaner, text):
+    text = cleaner.clean_text(text)
+    return cleaner.build_links(text)
+
+def check_regressions(cleaner):
+    for method, text, expected in REGRESSION_CASES:
+        output = getattr(cleaner, method)(text)
+        assert output == expected, 'Cleaner.%s(%r) returned %r instead of %r' % (method, text, output, expected)
+    print('All %d regression cases passed' % len(REGRESSION_CASES))
+
+def benchmark(cleaner, size):
+    print('%-25s %10s %10s %8s' % ('CASE', 'SIZE/2', 'SIZE', 'RATIO'))
+    for name, generate_page in PATHOLOGICAL_PAGES.items():
+        timings = []
+        for n in [size // 2, size]:
+            page = generate_page(n)
+            start = time()
+            clean(cleaner, page)
+            timings.append(time() - start)
+        print('%-25s %9.3fs %9.3fs %8.2f' % (name, timings[0], timings[1], timings[1] / max(timings[0], 1e-6)))
+
+if __name__ == '__main__':
+    size_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    cleaner = Cleaner()
+    check_regressions(cleaner)
+    benchmark(cleaner, int(size_mb * (1 << 20)))
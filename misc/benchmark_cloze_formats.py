@@ -0,0 +1,47 @@
+'''
+Compare the size & load time of the cloze dataset as JSON (`cloze_dataset.json`) vs Parquet.
+The Parquet file is written from the JSON dataset, unless given.
+
+USAGE:
+$ <script.py> <cloze_dataset.json> [<parquet_file>]
+
+EXAMPLE:
+$ python misc/benchmark_cloze_formats.py output/hi/cloze_dataset.json
+'''
+
+import os, sys
+import json
+from time import time
+
+from src.cloze_parquet import ParquetClozeWriter, read_cloze_dataset
+
+def timed(fn):
+    begin = time()
+    result = fn()
+    return result, time() - begin
+
+def load_json(json_file):
+    with open(json_file, encoding='utf-8') as f:
+        return json.load(f)['cloze_data']
+
+if __name__ == '__main__':
+    json_file = sys.argv[1]
+    parquet_file = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(json_file)[0] + '.parquet'
+
+    data, json_time = timed(lambda: load_json(json_file))
+    if not os.path.isfile(parquet_file):
+        writer = ParquetClozeWriter(parquet_file)
+        for cloze in data:
+            writer.write(cloze)
+        writer.close()
+
+    print('%-40s %10s %10s' % ('', 'Size (MB)', 'Load (s)'))
+    print('%-40s %10.2f %10.3f' % ('JSON (all fields, as dicts)', os.path.getsize(json_file) / 1e6, json_time))
+    parquet_size = os.path.getsize(parquet_file) / 1e6
+    table, parquet_time = timed(lambda: read_cloze_dataset(parquet_file))
+    print('%-40s %10.2f %10.3f' % ('Parquet (all columns, as table)', parquet_size, parquet_time))
+    rows, rows_time = timed(lambda: read_cloze_dataset(parquet_file).to_pylist())
+    print('%-40s %10.2f %10.3f' % ('Parquet (all columns, as dicts)', parquet_size, rows_time))
+    _, columns_time = timed(lambda: read_cloze_dataset(parquet_file, ['question', 'options', 'answer']))
+    print('%-40s %10.2f %10.3f' % ('Parquet (question, options, answer)', parquet_size, columns_time))
+    assert table.num_rows == len(data)
@@ -0,0 +1,73 @@
+'''
+Throughput comparison of the Wiki XML dump reader against the old line-based reader, on a synthetic dump.
+
+USAGE:
+$ <script.py> [num_pages]
+
+EXAMPLE:
+$ python misc/benchmark_dump_reader.py 50000
+'''
+
+import os, sys
+import codecs
+import random
+import tempfile
+from time import time
+from xml.etree import ElementTree
+
+from utils.wiki_dump_reader import iterate
+
+def iterate_by_lines(file_path):
+    # The earlier reader: Rebuilds every page from stripped lines & parses it as a separate tree
+    with codecs.open(file_path, 'r', 'utf8') as reader:
+        content = None
+        for line in reader:
+            line = line.strip()
+            if line == '<page>':
+                content = [line]
+            elif line == '</page>':
+                content.append(line)
+                tree = ElementTree.fromstring('\n'.join(content))
+                content = None
+                ns_elem = tree.find('ns')
+                if ns_elem is None or ns_elem.text.strip() != '0':
+                    continue
+                title_elem = tree.find('title')
+                text_elem = tree.find('revision/text')
+                if title_elem is None or text_elem is None or text_elem.text is None:
+                    continue
+                yield title_elem.text, text_elem.text
+            elif type(content) is list:
+                content.append(line)
+
+def write_synthetic_dump(file_path, num_pages):
+    words = ['भारत', 'देश', 'नदी', '[[गंगा]]', '{{cite|x}}', "'''शहर'''", '<ref>स्रोत</ref>', 'है', 'और', 'का']
+    random.seed(666)
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write('<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/" xml:lang="hi">\n')
+        f.write('  <siteinfo>\n    <sitename>विकिपीडिया</sitename>\n  </siteinfo>\n')
+        for i in range(num_pages):
+            ns = 0 if i % 5 else 14
+            paragraphs = [' '.join(random.choice(words) for _ in range(random.randint(20, 120))) for _ in range(random.randint(3, 30))]
+            text = '\n\n'.join(paragraphs).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+            f.write('  <page>\n    <title>लेख %d</title>\n    <ns>%d</ns>\n    <id>%d</id>\n' % (i, ns, i))
+            f.write('    <revision>\n      <id>%d</id>\n      <text bytes="%d" xml:space="preserve">%s</text>\n    </revision>\n  </page>\n'
+                    % (i, len(text), text))
+        f.write('</mediawiki>\n')
+
+def benchmark(name, reader, file_path):
+    size_mb = os.path.getsize(file_path) / (1 << 20)
+    start = time()
+    num_pages = sum(1 for _ in reader(file_path))
+    elapsed = time() - start
+    print('%-12s %8d pages in %6.2fs  -->  %9.1f pages/sec, %6.1f MB/sec' %
+          (name, num_pages, elapsed, num_pages / elapsed, size_mb / elapsed))
+
+if __name__ == '__main__':
+    num_pages = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dump_file = os.path.join(tmp_dir, 'synthetic.xml')
+        write_synthetic_dump(dump_file, num_pages)
+        print('Synthetic dump of %.1f MB' % (os.path.getsize(dump_file) / (1 << 20)))
+        benchmark('line-based', iterate_by_lines, dump_file)
+        benchmark('streaming', iterate, dump_file)
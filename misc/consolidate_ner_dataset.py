@@ -9,14 +9,12 @@ $ python misc/consolidate_ner_dataset.py hi output/hi/ner_list.json output/hi/ar
 '''
 
 import os, sys
-import json
-import requests
 import traceback
-from glob import glob
 from tqdm import tqdm
 
-from utils.file_utils import pretty_write_json
-from utils.net_utils import multi_get_batch
+from utils.file_utils import write_json, read_json
+from utils.net_utils import multi_get_batch, get_http_client
+from utils.article_store import open_article_store
 
 class Wiki_NER_Consolidator:
     def __init__(self, lang_code, ner_file, wiki_articles_dir):
@@ -24,23 +22,15 @@ class Wiki_NER_Consolidator:
         # Args = (qid)
         self.WIKIDATA_ALIASES_API = 'https://www.wikidata.org/w/api.php?action=wbgetentities&ids=%s&props=aliases&format=json&languages=' + lang_code
         
-        with open(ner_file, encoding='utf-8') as f:
-            self.ner_data = json.load(f)
+        self.ner_data = read_json(ner_file)
         
         self.scrape_wiki_entities(wiki_articles_dir)
         self.ner_to_qmap()
         
     def scrape_wiki_entities(self, wiki_articles_dir):
         print('Scraping for aliases from Wikipedia articles...')
-        articles_json = sorted(glob(os.path.join(wiki_articles_dir, '*.json')))
-        for article_file in tqdm(articles_json, desc='Processing', unit=' articles'):
-            try:
-                with open(article_file, encoding='utf-8') as f:
-                    article = json.load(f)
-            except:
-                print(traceback.format_exc())
-                print('Unable to parse:', article_file)
-                continue
+        articles = open_article_store(wiki_articles_dir)
+        for article in tqdm(articles, total=len(articles), desc='Processing', unit=' articles'):
             # TODO: Do more aggressive scraping rather than just links. Think of a logic
             for entity in article['links']:
                 link_name = entity['link'].replace(' ', '_')
@@ -79,7 +69,7 @@ class Wiki_NER_Consolidator:
     
     def get_wikidata_aliases(self, qid):
         try:
-            response = requests.get(self.WIKIDATA_ALIASES_API % qid)
+            response = get_http_client().get(self.WIKIDATA_ALIASES_API % qid)
             #if response.status_code != 200:
             #    return None
             data = response.json()
@@ -110,7 +100,7 @@ class Wiki_NER_Consolidator:
         print('We now have a NER dataset of %d QIDs and %d entities!' % (len(self.qid2ner), total_entities))
         # TODO: Any better format to save?
         print('Writing final dataset to:', dataset_file)
-        pretty_write_json(self.qid2ner, dataset_file)
+        write_json(self.qid2ner, dataset_file)
         return
     
     def consolidate_parallel(self, output_dir, num_workers=128):
@@ -136,7 +126,7 @@ class Wiki_NER_Consolidator:
         os.makedirs(output_dir, exist_ok=True)
         dataset_file = os.path.join(output_dir, 'ner_dataset.json')
         print('Writing final dataset to:', dataset_file)
-        pretty_write_json(self.qid2ner, dataset_file)
+        write_json(self.qid2ner, dataset_file)
         return
 
 if __name__ == '__main__':
@@ -0,0 +1,86 @@
+'''
+Columnar (Parquet) output of the cloze dataset.
+
+Each cloze is a row; `options` is a list column and `category` is dictionary-encoded.
+The rows are written in row-groups as they come, so the whole dataset is never in memory,
+and the readers can memory-map the file and load only the columns they need.
+
+Needs `pyarrow` (pip install pyarrow).
+
+USAGE (to read few columns of the dataset):
+$ <script.py> <parquet_file> [<column> ...]
+'''
+
+import sys
+import json
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+def get_cloze_schema():
+    return pa.schema([
+        ('question', pa.string()),
+        ('answer', pa.string()),
+        ('category', pa.dictionary(pa.int8(), pa.string())),
+        ('title', pa.string()),
+        ('options', pa.list_(pa.string())),
+        ('out_of_context_options', pa.list_(pa.string())),
+    ])
+
+class ParquetClozeWriter():
+    # Same interface as the article stores: write(), len() and close()
+    def __init__(self, parquet_file, row_group_size=100000, compression='zstd', metadata=None):
+        if pa is None:
+            raise ImportError('Please `pip install pyarrow` for the parquet output')
+        self.row_group_size = row_group_size
+        self.schema = get_cloze_schema()
+        if metadata: # Say the params of the generator
+            self.schema = self.schema.with_metadata({'cloze_metadata': json.dumps(metadata, ensure_ascii=False)})
+        self.writer = pq.ParquetWriter(parquet_file, self.schema, compression=compression)
+        self.columns = {name: [] for name in self.schema.names}
+        self.num_clozes = 0
+
+    def write(self, cloze):
+        for name, values in self.columns.items():
+            values.append(cloze.get(name))
+        self.num_clozes += 1
+        if len(self.columns['question']) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.columns['question']:
+            return
+        self.writer.write_table(pa.Table.from_pydict(self.columns, schema=self.schema))
+        for values in self.columns.values():
+            values.clear()
+
+    def __len__(self):
+        return self.num_clozes
+
+    def close(self):
+        if self.writer is None:
+            return
+        self.flush()
+        self.writer.close()
+        self.writer = None
+
+def read_cloze_dataset(parquet_file, columns=None):
+    # Returns a pyarrow Table of the given columns (all if None), reading the file memory-mapped.
+    # Use `.to_pylist()` for a list of cloze dicts, or `.to_pandas()`
+    if pa is None:
+        raise ImportError('Please `pip install pyarrow` to read the parquet output')
+    return pq.read_table(parquet_file, columns=columns, memory_map=True)
+
+def read_cloze_metadata(parquet_file):
+    # The metadata (say the params of the generator) saved with the dataset
+    metadata = pq.read_schema(parquet_file, memory_map=True).metadata or {}
+    return json.loads(metadata[b'cloze_metadata']) if b'cloze_metadata' in metadata else None
+
+if __name__ == '__main__':
+    table = read_cloze_dataset(sys.argv[1], sys.argv[2:] or None)
+    print(table.schema)
+    print('%d clozes. First few:' % table.num_rows)
+    print(json.dumps(table.slice(0, 3).to_pylist(), ensure_ascii=False, indent=4))
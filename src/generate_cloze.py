@@ -2,39 +2,78 @@
 Code to generate cloze task dataset given the list of all Wiki articles and Entity-to-category NER map.
 
 USAGE:
-$ <script.py> <lang_code> <ner_file> <articles_folder> <output_folder>
+$ <script.py> <lang_code> <ner_file> <articles_folder> <output_folder> [--titles_file <txt_file>] [--num_workers N] [--seed S]
+    [--negative_sampling uniform|frequency|length] [--context_windows truncate|sliding] [--output_format json|jsonl|parquet]
+
+The articles folder can be any article store written by wiki2json.py
+To regenerate the clozes only for few articles, pass a txt file of their titles (one per line).
+By default, a paragraph longer than the max. context is truncated to its first few sentences; with
+`--context_windows sliding`, it is split into many consecutive windows of whole sentences instead.
+With `--output_format jsonl`, the dataset is consolidated as it is read into sharded JSON lines (in constant memory),
+split into train/dev/test by the hash of the article title, with the metadata in a separate file.
+`--output_format parquet` is the same, but writes a columnar Parquet file for each split (needs pyarrow).
 
 EXAMPLE:
 $ python src/generate_cloze.py hi output/hi/ner_list.json output/hi/articles/ output/hi/
 '''
 
-import os, sys
-import json
+import os
+import re
+import hashlib
+import argparse
 import random
-import traceback
+import multiprocessing
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from glob import glob
 from tqdm import tqdm
 from datetime import datetime
 
-from utils.lang_utils import EOS_DELIMITERS
-from utils.file_utils import pretty_write_json, get_verified_path
+from src.negative_sampler import NegativeSampler
+from src.cloze_parquet import ParquetClozeWriter
+from utils.lang_utils import get_sentence_end_pattern
+from utils.file_utils import pretty_write_json, write_json, read_json, get_verified_path
+from utils.article_store import open_article_store, JSONLStore
+from utils.parallel_utils import batched, bounded_map
+
+# The generator used by the worker processes. Inherited on fork, so that the
+# read-only NER data is shared copy-on-write instead of being pickled to each worker.
+worker_generator = None
+
+def generate_for_batch(args):
+    return worker_generator.generate_for_batch(*args)
 
 class ClozeGenerator():
+    # truncate : Only the first few sentences of a long paragraph, which fit in the context
+    # sliding  : Consecutive windows of sentences, covering the whole paragraph
+    CONTEXT_WINDOW_MODES = ['truncate', 'sliding']
+    # json  : A single JSON file of the whole dataset (and of each split)
+    # jsonl   : Sharded JSON lines, written as the clozes are read
+    # parquet : Columnar Parquet files, written in row-groups as the clozes are read
+    OUTPUT_FORMATS = ['json', 'jsonl', 'parquet']
+    
     def __init__(self, lang_code, wiki_articles_dir, ner_file):
         self.LANG_CODE = lang_code
-        self.full_stop = EOS_DELIMITERS[lang_code]
+        self.sentence_end_pattern = get_sentence_end_pattern(lang_code)
+        self.word_pattern = re.compile(r'\S+')
             
         # Parameters
         
         # Range of no. of words to be present in the question
         self.MIN_CONTEXT_WORDS = 30
         self.MAX_CONTEXT_WORDS = 100
+        # How to get the contexts from paragraphs longer than above? One of CONTEXT_WINDOW_MODES
+        self.CONTEXT_WINDOW_MODE = 'truncate'
         # Minimum no. of -ve options that must atleast be there in the article
         self.MIN_NEGATIVE_CONTEXT_OPTIONS_PER_CLOZE = 2
         # Max. no. of -ve options in the cloze
         self.MAX_NEGATIVE_OPTIONS_PER_CLOZE = 3
         # Should we pick -ve options from global set if above is not satisfied?
         self.ALLOW_GLOBAL_NEGATIVE_OPTIONS = True
+        # How to pick the global -ve options? One of NegativeSampler.SAMPLING_MODES
+        self.NEGATIVE_SAMPLING_MODE = 'uniform'
         # How many questions per article max?
         self.MAX_CLOZES_PER_ARTICLE = 5
         # For now, generate blanks of only 1 word
@@ -46,11 +85,18 @@ class ClozeGenerator():
         self.DEV_SPLIT   = 0.1
         self.TEST_SPLIT  = 0.1
         
-        # List of all Wiki article files
-        self.articles_json = sorted(glob(os.path.join(wiki_articles_dir, '*.json')))
+        # Master seed for the random choices. Each article gets its own RNG seeded with
+        # this & its title, so that the results do not depend on the order or no. of workers.
+        self.SEED = 666
+        self.ARTICLES_PER_BATCH = 64
+        # No. of clozes in each shard of the `jsonl` output, and the sample of clozes dumped for a quick look
+        self.CLOZES_PER_SHARD = 100000
+        self.SAMPLE_SIZE = 20
+        
+        # Store of all Wiki articles
+        self.articles = open_article_store(wiki_articles_dir)
         # Load NER data
-        with open(ner_file, encoding='utf-8') as f:
-            self.ner_data = json.load(f)
+        self.ner_data = read_json(ner_file)
         
         # Create a global map of category->entities
         self.category_to_entities = {}
@@ -63,6 +109,8 @@ class ClozeGenerator():
                 if len(entity_name.split()) > self.MAX_WORDS_IN_ANSWER:
                     continue
                 self.category_to_entities[category].add(entity.replace('_', ' '))
+        # Index to sample global -ve options from, built on first use
+        self.negative_sampler = None
     
     def get_params_dict(self):
         # TODO: Make it neat
@@ -70,14 +118,30 @@ class ClozeGenerator():
             'LANG_CODE': self.LANG_CODE,
             'MIN_CONTEXT_WORDS': self.MIN_CONTEXT_WORDS,
             'MAX_CONTEXT_WORDS': self.MAX_CONTEXT_WORDS,
+            'CONTEXT_WINDOW_MODE': self.CONTEXT_WINDOW_MODE,
             'MIN_NEGATIVE_CONTEXT_OPTIONS_PER_CLOZE': self.MIN_NEGATIVE_CONTEXT_OPTIONS_PER_CLOZE,
             'MAX_NEGATIVE_OPTIONS_PER_CLOZE': self.MAX_NEGATIVE_OPTIONS_PER_CLOZE,
             'ALLOW_GLOBAL_NEGATIVE_OPTIONS': self.ALLOW_GLOBAL_NEGATIVE_OPTIONS,
+            'NEGATIVE_SAMPLING_MODE': self.NEGATIVE_SAMPLING_MODE,
             'MAX_CLOZES_PER_ARTICLE': self.MAX_CLOZES_PER_ARTICLE,
             'MAX_WORDS_IN_ANSWER': self.MAX_WORDS_IN_ANSWER,
             'MASK_TOKEN': self.MASK_TOKEN,
         }
     
+    def count_entity_frequencies(self):
+        # No. of times each entity is linked across all the articles
+        entity_counts = Counter()
+        for article in tqdm(self.articles, total=len(self.articles), desc='Counting entities', unit=' articles'):
+            for link in article['links']:
+                entity_counts[link['link'].replace('_', ' ')] += 1
+        return entity_counts
+    
+    def get_negative_sampler(self):
+        if self.negative_sampler is None:
+            entity_counts = self.count_entity_frequencies() if self.NEGATIVE_SAMPLING_MODE == 'frequency' else None
+            self.negative_sampler = NegativeSampler(self.category_to_entities, self.NEGATIVE_SAMPLING_MODE, entity_counts)
+        return self.negative_sampler
+    
     def map_article_ner(self, article):
         # Map NER categories to the entities (links) in Wiki article
         entities, category2entities = [], {}
@@ -92,22 +156,29 @@ class ClozeGenerator():
                 if link['category'] not in category2entities:
                     category2entities[link['category']] = set()
                 category2entities[link['category']].add(entity_name)
-                self.category_to_entities[link['category']].add(entity_name)
                 del link['link']
                 entities.append(link)
         del article['links']
+        # Index of the entities by their begin offset, to find the entities of any context by binary search
+        entities.sort(key=lambda entity: entity['begin'])
         article['entities'] = entities
+        article['entity_begins'] = array('q', (entity['begin'] for entity in entities))
         article['category2entities'] = category2entities
         return
     
-    def get_cloze_from_context(self, context, index, article):
+    def get_article_rng(self, article):
+        # Random generator specific to the article, derived from the master seed
+        return random.Random('%d:%s' % (self.SEED, article['title']))
+    
+    def get_cloze_from_context(self, context, index, article, rng):
         end_index = index + len(context)
         category2entities = article['category2entities']
-        for entity in article['entities']: #Assumes sorted based on begin index
+        entities = article['entities']
+        # Skip all the entities before the context
+        for entity_id in range(bisect_left(article['entity_begins'], index), len(entities)):
+            entity = entities[entity_id]
             
             # Check boundary cases
-            if entity['begin'] < index:
-                continue
             if entity['begin'] + len(entity['text']) > end_index:
                 break
             
@@ -132,26 +203,62 @@ class ClozeGenerator():
             }
             
             # Get negative options randomly, add the right answer and shuffle
-            negative_options = set(article['category2entities'][category])
-            negative_options.remove(entity['text'])
-            negative_options = list(negative_options)
-            random.shuffle(negative_options)
+            negative_options = sorted(article['category2entities'][category] - {entity['text']})
+            rng.shuffle(negative_options)
             negative_options = negative_options[:self.MAX_NEGATIVE_OPTIONS_PER_CLOZE]
             
             # Pick negative options from global set if insufficient
             if len(negative_options) < self.MAX_NEGATIVE_OPTIONS_PER_CLOZE and self.ALLOW_GLOBAL_NEGATIVE_OPTIONS:
-                global_negative_options = random.sample(self.category_to_entities[category], self.MAX_NEGATIVE_OPTIONS_PER_CLOZE-len(negative_options))
+                global_negative_options = self.get_negative_sampler().sample(
+                    category, self.MAX_NEGATIVE_OPTIONS_PER_CLOZE-len(negative_options), rng,
+                    exclude=negative_options, answer=positive_option)
                 negative_options += global_negative_options
                 cloze['out_of_context_options'] = global_negative_options # For debugging only
             options = negative_options + [positive_option]
-            random.shuffle(options)
+            rng.shuffle(options)
             cloze['options'] = options
             return cloze
             
         return {}
     
+    def get_context_windows(self, line):
+        # (begin, end) offsets of the contexts in the paragraph, to make the clozes from
+        word_begins = [match.start() for match in self.word_pattern.finditer(line)]
+        # Skip if the context is not big enough
+        if len(word_begins) < self.MIN_CONTEXT_WORDS:
+            return []
+        if len(word_begins) <= self.MAX_CONTEXT_WORDS:
+            return [(0, len(line))]
+        
+        # End offset of each sentence, and the no. of words till there
+        sentence_ends = [match.end() for match in self.sentence_end_pattern.finditer(line) if match.start() > 0]
+        words_till_end = [bisect_left(word_begins, end) for end in sentence_ends]
+        
+        if self.CONTEXT_WINDOW_MODE == 'truncate':
+            # Remove few sentences from the end, since the context is too big
+            num_sentences = bisect_right(words_till_end, self.MAX_CONTEXT_WORDS)
+            return [(0, sentence_ends[num_sentences-1])] if num_sentences else []
+        
+        # Sliding windows: as many whole sentences as would fit in each window
+        if not sentence_ends or sentence_ends[-1] < len(line):
+            sentence_ends.append(len(line))
+            words_till_end.append(len(word_begins))
+        windows, begin_word = [], 0
+        while begin_word < len(word_begins):
+            num_sentences = bisect_right(words_till_end, begin_word + self.MAX_CONTEXT_WORDS)
+            if num_sentences == 0 or words_till_end[num_sentences-1] <= begin_word:
+                # The next sentence alone is too long, so skip it
+                begin_word = words_till_end[bisect_right(words_till_end, begin_word)]
+                continue
+            end_word = words_till_end[num_sentences-1]
+            if end_word - begin_word >= self.MIN_CONTEXT_WORDS:
+                windows.append((word_begins[begin_word], sentence_ends[num_sentences-1]))
+            begin_word = end_word
+        return windows
+    
     def generate_for_article(self, article):
         self.map_article_ner(article)
+        rng = self.get_article_rng(article)
             
         context_begin_index, next_context_index = 0, 0
         cloze_list = []
@@ -159,27 +266,12 @@ class ClozeGenerator():
             context_begin_index = next_context_index
             next_context_index += len(line) + 1
             
-            # Skip if the context is not big enough
-            if len(line.split()) < self.MIN_CONTEXT_WORDS:
-                continue
-            
-            # Remove few sentences from the end if context is too big
-            while len(line.split()) > self.MAX_CONTEXT_WORDS:
-                full_stop_index = line.rfind(self.full_stop)
-                if full_stop_index == len(line) - 1:
-                    full_stop_index = line[:full_stop_index].rfind(self.full_stop)
-                if full_stop_index > 0:
-                    # Sincerely hope that the full stop means end of sentence
-                    line = line[:full_stop_index+1]
-                else:
-                    break
-            
-            if len(line.split()) <= self.MAX_CONTEXT_WORDS:
-                cloze = self.get_cloze_from_context(line, context_begin_index, article)
+            for begin, end in self.get_context_windows(line):
+                cloze = self.get_cloze_from_context(line[begin:end], context_begin_index + begin, article, rng)
                 if cloze:
                     cloze_list.append(cloze)
                     if len(cloze_list) >= self.MAX_CLOZES_PER_ARTICLE:
-                        break
+                        return cloze_list
         
         return cloze_list
     
@@ -188,71 +280,201 @@ class ClozeGenerator():
         article_files = sorted(glob(os.path.join(articles_dir, '*.json')))
         data = [] #WARN: Can be RAM consuming.
         for article_file in tqdm(article_files, desc='Consolidating', unit=' articles'):
-            with open(article_file, encoding='utf-8') as f:
-                cloze_list = json.load(f)
-            data += cloze_list
+            data += read_json(article_file)
         
         dataset = {
             'params': self.get_params_dict(),
             'metadata': {
                 'TOTAL_CLOZES': len(data),
-                'PROCESSED_WIKI_ARTICLES': len(self.articles_json),
+                'PROCESSED_WIKI_ARTICLES': len(self.articles),
                 'GENERATED_TIMESTAMP': str(datetime.now())
             },
             'cloze_data': data
         }
         dataset_file = os.path.join(output_dir, 'cloze_dataset.json')
-        pretty_write_json(dataset, dataset_file)
+        write_json(dataset, dataset_file)
         print('Final dataset written to:', dataset_file, '\n')
         
         # Dump a sample of few questions
-        random.seed(666)
-        random.shuffle(data)
+        random.Random(self.SEED).shuffle(data)
         sample_file = os.path.join(output_dir, 'cloze_sample.json')
         pretty_write_json(data[:20], sample_file)
         print('Sample dataset written to:', sample_file, '\n')
         
         if train_split:
             train_split_len = int(self.TRAIN_SPLIT * len(data))
-            pretty_write_json(data[:train_split_len], os.path.join(output_dir, 'cloze_train_set.json'))
+            write_json(data[:train_split_len], os.path.join(output_dir, 'cloze_train_set.json'))
             
             dev_split_len = int(self.DEV_SPLIT * len(data))
-            pretty_write_json(data[train_split_len:train_split_len+dev_split_len], os.path.join(output_dir, 'cloze_dev_set.json'))
+            write_json(data[train_split_len:train_split_len+dev_split_len], os.path.join(output_dir, 'cloze_dev_set.json'))
             
             test_split_len = len(data) - (train_split_len+dev_split_len)
-            pretty_write_json(data[train_split_len+dev_split_len:], os.path.join(output_dir, 'cloze_test_set.json'))
+            write_json(data[train_split_len+dev_split_len:], os.path.join(output_dir, 'cloze_test_set.json'))
             
             print('Dataset split into Train-Dev-Test and saved at ', output_dir)
             print('Split ratio %.2f:%.2f:%.2f and count %d:%d:%d\n' %
                   (self.TRAIN_SPLIT, self.DEV_SPLIT, self.TEST_SPLIT, train_split_len, dev_split_len, test_split_len))
         return
     
-    def generate(self, output_dir, consolidate=True, train_split=False):
-        save_to = os.path.join(output_dir, 'cloze_set')
-        os.makedirs(save_to)#, exist_ok=True) # Delete the folder yourself if it exists
-        total_data_count = 0
-        for article_file in tqdm(self.articles_json, desc='Generating cloze', unit=' articles'):
-            try:
-                with open(article_file, encoding='utf-8') as f:
-                    article = json.load(f)
-            except:
-                print(traceback.format_exc())
-                print('Unable to parse:', article_file)
+    def get_split(self, title):
+        # Train/dev/test split of the article, by a stable hash of its title.
+        # So all the clozes of an article are in the same split, irrespective of the order.
+        digest = hashlib.md5(('%d:%s' % (self.SEED, title)).encode('utf-8')).digest()
+        fraction = int.from_bytes(digest[:8], 'big') / 2**64
+        if fraction < self.TRAIN_SPLIT:
+            return 'train'
+        if fraction < self.TRAIN_SPLIT + self.DEV_SPLIT:
+            return 'dev'
+        return 'test'
+    
+    def iterate_clozes(self, articles_dir):
+        # Clozes of all the articles, reading one article file at a time
+        for article_file in tqdm(sorted(glob(os.path.join(articles_dir, '*.json'))), desc='Consolidating', unit=' articles'):
+            yield from read_json(article_file)
+    
+    def get_split_writer(self, dataset_dir, split, output_format):
+        if output_format == 'parquet':
+            return ParquetClozeWriter(os.path.join(dataset_dir, split + '.parquet'), self.CLOZES_PER_SHARD,
+                                      metadata={'params': self.get_params_dict(), 'split': split})
+        return JSONLStore(os.path.join(dataset_dir, split), 'w', articles_per_shard=self.CLOZES_PER_SHARD)
+    
+    def consolidate_streaming(self, articles_dir, output_dir, train_split=False, output_format='jsonl'):
+        # Write the clozes into sharded JSONL stores or Parquet files (one for each split) as they are read
+        dataset_dir = os.path.join(output_dir, 'cloze_dataset')
+        os.makedirs(dataset_dir, exist_ok=True)
+        splits = ['train', 'dev', 'test'] if train_split else ['all']
+        stores = {split: self.get_split_writer(dataset_dir, split, output_format) for split in splits}
+        
+        # Reservoir sample of the clozes
+        rng = random.Random(self.SEED)
+        sample, total_clozes = [], 0
+        for cloze in self.iterate_clozes(articles_dir):
+            stores[self.get_split(cloze['title']) if train_split else 'all'].write(cloze)
+            total_clozes += 1
+            if len(sample) < self.SAMPLE_SIZE:
+                sample.append(cloze)
+            else:
+                index = rng.randrange(total_clozes)
+                if index < self.SAMPLE_SIZE:
+                    sample[index] = cloze
+        for store in stores.values():
+            store.close()
+        
+        metadata_file = os.path.join(dataset_dir, 'metadata.json')
+        pretty_write_json({
+            'params': self.get_params_dict(),
+            'metadata': {
+                'TOTAL_CLOZES': total_clozes,
+                'PROCESSED_WIKI_ARTICLES': len(self.articles),
+                'GENERATED_TIMESTAMP': str(datetime.now()),
+                'SPLITS': {split: len(store) for split, store in stores.items()},
+            }
+        }, metadata_file)
+        print('Final dataset written to:', dataset_dir, '\n')
+        
+        sample_file = os.path.join(output_dir, 'cloze_sample.json')
+        pretty_write_json(sample, sample_file)
+        print('Sample dataset written to:', sample_file, '\n')
+        if train_split:
+            print('Dataset split into Train-Dev-Test by article, with count %d:%d:%d\n' %
+                  tuple(len(stores[split]) for split in splits))
+        return
+    
+    def get_article_batches(self, titles=None):
+        # Small references to the batches of articles (not the articles), which each worker reads from the store.
+        # All the articles, or only those with the given titles.
+        if titles is None:
+            return (('store', batch) for batch in self.articles.get_batches(self.ARTICLES_PER_BATCH))
+        return (('titles', batch) for batch in batched(titles, self.ARTICLES_PER_BATCH))
+    
+    def read_article_batch(self, batch):
+        # Returns the articles of the batch, and the no. of articles it was meant to have
+        batch_type, batch = batch
+        if batch_type == 'store':
+            articles = self.articles.read_batch(batch)
+            return articles, len(articles)
+        articles = []
+        for title in batch:
+            article = self.articles.get(title)
+            if article is None:
+                print('Article not found:', title)
                 continue
-            
+            articles.append(article)
+        return articles, len(batch)
+    
+    def generate_for_batch(self, batch, save_to):
+        # Generate & save the clozes for a batch of articles. Returns the no. of clozes.
+        articles, batch_size = self.read_article_batch(batch)
+        data_count = 0
+        for article in articles:
             cloze_list = self.generate_for_article(article)
             if cloze_list: # Save the cloze for this article
                 save_filepath = get_verified_path(save_to, article['title'], '.json')
-                pretty_write_json(cloze_list, save_filepath)
-                total_data_count += len(cloze_list)
+                write_json(cloze_list, save_filepath)
+                data_count += len(cloze_list)
+        return data_count, batch_size
+    
+    def generate(self, output_dir, consolidate=True, train_split=False, titles=None, num_workers=1, output_format='json'):
+        save_to = os.path.join(output_dir, 'cloze_set')
+        # Delete the folder yourself if it exists, unless regenerating for few titles
+        os.makedirs(save_to, exist_ok=titles is not None)
+        total_data_count = 0
+        num_articles = len(titles) if titles is not None else len(self.articles)
+        
+        # Only the references to the batches are sent to the workers, which read & decode the articles themselves
+        batches = ((batch, save_to) for batch in self.get_article_batches(titles))
+        # Build the sampling index before forking, so that the workers share it
+        self.get_negative_sampler()
+        executor = None
+        if num_workers > 1:
+            global worker_generator
+            worker_generator = self
+            executor = ProcessPoolExecutor(num_workers, mp_context=multiprocessing.get_context('fork'))
+            results = bounded_map(executor, generate_for_batch, batches, 4*num_workers)
+        else:
+            results = (self.generate_for_batch(*batch) for batch in batches)
+        
+        with tqdm(total=num_articles, desc='Generating cloze', unit=' articles') as pbar:
+            for data_count, batch_size in results:
+                total_data_count += data_count
+                pbar.update(batch_size)
+        if executor:
+            executor.shutdown()
         
         print('SUCCESS: Generated a total of %d cloze questions!' % total_data_count)
         print('For individual results, check the folder:', save_to, '\n')
-        if consolidate:
+        if consolidate and output_format != 'json':
+            self.consolidate_streaming(save_to, output_dir, train_split, output_format)
+        elif consolidate:
             self.consolidate(save_to, output_dir, train_split)
         return
 
 if __name__ == '__main__':
-    lang_code, ner_file, articles_folder, output_folder = sys.argv[1:]
-    g = ClozeGenerator(lang_code, articles_folder, ner_file)
-    g.generate(output_folder)
+    parser = argparse.ArgumentParser(description='Generate cloze dataset from the Wiki articles')
+    parser.add_argument('lang_code')
+    parser.add_argument('ner_file')
+    parser.add_argument('articles_folder')
+    parser.add_argument('output_folder')
+    parser.add_argument('--titles_file', default=None, help='Generate only for the articles with these titles')
+    parser.add_argument('--num_workers', type=int, default=1, help='No. of processes to generate the clozes')
+    parser.add_argument('--seed', type=int, default=666, help='Seed for the random choices')
+    parser.add_argument('--negative_sampling', default='uniform', choices=NegativeSampler.SAMPLING_MODES,
+                        help='How to pick -ve options from the global set of entities')
+    parser.add_argument('--context_windows', default='truncate', choices=ClozeGenerator.CONTEXT_WINDOW_MODES,
+                        help='How to get the contexts from long paragraphs')
+    parser.add_argument('--output_format', default='json', choices=ClozeGenerator.OUTPUT_FORMATS,
+                        help='Format of the consolidated dataset')
+    parser.add_argument('--train_split', action='store_true', help='Also split the dataset into train/dev/test')
+    args = parser.parse_args()
+    
+    titles = None
+    if args.titles_file:
+        with open(args.titles_file, encoding='utf-8') as f:
+            titles = [line.strip() for line in f if line.strip()]
+    
+    g = ClozeGenerator(args.lang_code, args.articles_folder, args.ner_file)
+    g.SEED = args.seed
+    g.NEGATIVE_SAMPLING_MODE = args.negative_sampling
+    g.CONTEXT_WINDOW_MODE = args.context_windows
+    g.generate(args.output_folder, titles=titles, num_workers=args.num_workers,
+               train_split=args.train_split, output_format=args.output_format)
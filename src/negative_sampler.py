@@ -0,0 +1,93 @@
+'''
+Index to sample the out-of-context (global) negative options of a cloze.
+
+The per-category pools of entity names are built once and then frozen (as sorted tuples),
+so that sampling is O(1) per option and reproducible given the RNG.
+'''
+
+from bisect import bisect
+from array import array
+from itertools import accumulate
+
+class NegativeSampler():
+    # uniform   : Every entity of the category is equally likely
+    # frequency : Weighted by how often the entity is linked in the articles
+    # length    : Entities with length closest to the answer's length
+    SAMPLING_MODES = ['uniform', 'frequency', 'length']
+
+    def __init__(self, category_to_entities, mode='uniform', entity_counts=None):
+        if mode not in self.SAMPLING_MODES:
+            raise ValueError('Unknown negative sampling mode: %s' % mode)
+        if mode == 'frequency' and entity_counts is None:
+            raise ValueError('Entity counts are needed for frequency-weighted sampling')
+        self.mode = mode
+        self.pools = {category: tuple(sorted(entities)) for category, entities in category_to_entities.items()}
+
+        if mode == 'frequency':
+            # Cumulative weights for each pool. Add-one smoothing, so that all the entities are possible
+            self.cumulative_weights = {
+                category: array('d', accumulate(entity_counts.get(entity, 0) + 1 for entity in pool))
+                for category, pool in self.pools.items()
+            }
+        elif mode == 'length':
+            # Pool of each category split by the length of the entities
+            self.length_pools = {}
+            for category, pool in self.pools.items():
+                length_pools = {}
+                for entity in pool:
+                    length_pools.setdefault(len(entity), []).append(entity)
+                self.length_pools[category] = {length: tuple(entities) for length, entities in length_pools.items()}
+
+    def get_length_matched_pools(self, category, length, min_size):
+        # Pools of lengths closest to the given length, having atleast `min_size` entities in total
+        length_pools = self.length_pools.get(category, {})
+        pools, total_size = [], 0
+        for pool_length in sorted(length_pools, key=lambda l: (abs(l - length), l)):
+            pools.append(length_pools[pool_length])
+            total_size += len(length_pools[pool_length])
+            if total_size >= min_size:
+                break
+        return pools
+
+    def get_sampling_function(self, category, rng, answer, min_size):
+        # Returns the pools to sample from, and a function to sample one entity from them
+        if self.mode == 'length' and answer is not None:
+            pools = self.get_length_matched_pools(category, len(answer), min_size)
+            pool_ends = list(accumulate(len(pool) for pool in pools))
+            def sample_one():
+                index = rng.randrange(pool_ends[-1])
+                pool_id = bisect(pool_ends, index)
+                return pools[pool_id][index - (pool_ends[pool_id-1] if pool_id else 0)]
+            return pools, sample_one if pools else None
+
+        pool = self.pools.get(category, ())
+        if not pool:
+            return [], None
+        if self.mode == 'frequency':
+            cumulative_weights = self.cumulative_weights[category]
+            total_weight = cumulative_weights[-1]
+            return [pool], lambda: pool[min(bisect(cumulative_weights, rng.random() * total_weight), len(pool) - 1)]
+        return [pool], lambda: pool[rng.randrange(len(pool))]
+
+    def sample(self, category, k, rng, exclude=(), answer=None):
+        # Sample `k` distinct entities of the category, none of which is in `exclude`.
+        # `answer` is used for length matching. May return less than `k` if the pool is too small.
+        exclude = set(exclude)
+        if answer is not None:
+            exclude.add(answer)
+        pools, sample_one = self.get_sampling_function(category, rng, answer, 4 * (k + len(exclude)))
+        if sample_one is None:
+            return []
+
+        # Rejection sampling: cheap as long as the pool is much bigger than what is excluded
+        samples = []
+        for _ in range(8 * (k + len(exclude))):
+            entity = sample_one()
+            if entity not in exclude and entity not in samples:
+                samples.append(entity)
+                if len(samples) >= k:
+                    return samples
+
+        # Too many rejections (a small pool), so pick from what is left
+        remaining = [entity for pool in pools for entity in pool if entity not in exclude and entity not in samples]
+        return samples + rng.sample(remaining, min(k - len(samples), len(remaining)))
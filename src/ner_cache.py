@@ -0,0 +1,85 @@
+'''
+Persistent cache of the WikiData lookups, shared by all the runs (and languages) of `wiki2ner.py`.
+
+- QID to NER category (same for all languages)
+- Title to QID (for each language)
+
+Stored in SQLite (in WAL mode, so that many runs can read & write it concurrently).
+Entries older than the TTL are ignored, so that they are queried again.
+
+USAGE (to see the no. of cached entries):
+$ <script.py> <cache_file>
+'''
+
+import sys
+import sqlite3
+import threading
+from time import time
+
+from utils.parallel_utils import batched
+
+class NERCache():
+    # SQLite's limit on the no. of parameters in a query is 999 (in old versions)
+    MAX_PARAMS = 500
+
+    def __init__(self, db_file, ttl_days=90):
+        self.db_file = db_file
+        self.ttl = ttl_days * 24 * 60 * 60
+        # A connection for each thread
+        self.local = threading.local()
+        db = self.get_db()
+        db.execute('PRAGMA journal_mode = WAL')
+        db.execute('CREATE TABLE IF NOT EXISTS qid_category (qid TEXT PRIMARY KEY, category TEXT, updated REAL)')
+        db.execute('CREATE TABLE IF NOT EXISTS title_qid (lang TEXT, title TEXT, qid TEXT, updated REAL, PRIMARY KEY (lang, title))')
+        db.commit()
+
+    def get_db(self):
+        if not hasattr(self.local, 'db'):
+            # Wait for the other writers, instead of failing with `database is locked`
+            self.local.db = sqlite3.connect(self.db_file, timeout=60)
+            self.local.db.execute('PRAGMA synchronous = NORMAL')
+        return self.local.db
+
+    def get_categories(self, qids):
+        # NER categories of the cached QIDs (None if the entity has no category)
+        qid2category = {}
+        min_updated = time() - self.ttl
+        for batch in batched(qids, self.MAX_PARAMS):
+            query = 'SELECT qid, category FROM qid_category WHERE updated >= ? AND qid IN (%s)' % ','.join('?' * len(batch))
+            qid2category.update(self.get_db().execute(query, [min_updated] + batch))
+        return qid2category
+
+    def put_categories(self, qid2category):
+        db = self.get_db()
+        now = time()
+        with db:
+            db.executemany('INSERT OR REPLACE INTO qid_category VALUES (?, ?, ?)',
+                           [(qid, category, now) for qid, category in qid2category.items()])
+        return
+
+    def get_qids(self, lang_code, titles):
+        # QIDs of the cached titles of the given language
+        title2qid = {}
+        min_updated = time() - self.ttl
+        for batch in batched(titles, self.MAX_PARAMS):
+            query = 'SELECT title, qid FROM title_qid WHERE lang = ? AND updated >= ? AND title IN (%s)' % ','.join('?' * len(batch))
+            title2qid.update(self.get_db().execute(query, [lang_code, min_updated] + batch))
+        return title2qid
+
+    def put_qids(self, lang_code, title2qid):
+        db = self.get_db()
+        now = time()
+        with db:
+            db.executemany('INSERT OR REPLACE INTO title_qid VALUES (?, ?, ?, ?)',
+                           [(lang_code, title, qid, now) for title, qid in title2qid.items()])
+        return
+
+    def get_stats(self):
+        db = self.get_db()
+        stats = {'qid_category': db.execute('SELECT COUNT(*) FROM qid_category').fetchone()[0]}
+        for lang_code, count in db.execute('SELECT lang, COUNT(*) FROM title_qid GROUP BY lang'):
+            stats['title_qid:' + lang_code] = count
+        return stats
+
+if __name__ == '__main__':
+    print(NERCache(sys.argv[1]).get_stats())
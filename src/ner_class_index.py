@@ -0,0 +1,123 @@
+'''
+Precomputed index of all the WikiData classes under each NER category.
+
+Instead of evaluating `?item wdt:P31*/wdt:P279* wd:category` for every entity, the transitive closure of
+`subclass of` (P279) for each target category is materialised once (from SPARQL or a local WikiData dump)
+and saved as sorted arrays of class QIDs. An entity is then classified just by looking up its `instance of` (P31).
+
+The closure of a big category (like location) is too large for a single SPARQL query, which would time out.
+So it is found level by level: the direct subclasses of a few hundred classes of the current level per query,
+in pages of results. This takes a few thousand queries (at the rate-limit of SPARQL); building from a dump is faster.
+
+USAGE (to build the index using SPARQL):
+$ <script.py> <index_file>
+'''
+
+import sys
+import json
+from array import array
+
+from utils.parallel_utils import batched
+
+# Returns a page of the direct subclasses of the given classes. Args: (space-separated wd:QIDs, limit, offset)
+DIRECT_SUBCLASSES_QUERY = '''
+    SELECT DISTINCT ?class
+    WHERE {
+        VALUES ?parent { %s }
+        ?class wdt:P279 ?parent .
+    }
+    ORDER BY ?class
+    LIMIT %d OFFSET %d'''
+
+class SubclassIndex():
+    def __init__(self, tag2classes, tag_priority):
+        # Map of NER tag to the set of (int) class QIDs under it, and the order in which the tags are checked
+        self.tag2classes = {tag: frozenset(classes) for tag, classes in tag2classes.items()}
+        self.tag_priority = [tag for tag in tag_priority if tag in self.tag2classes]
+
+    @classmethod
+    def from_closures(cls, query_handler, get_subclass_closure):
+        # Build from a function which returns the set of all (int) subclasses of a category QID
+        tag2classes = {'PER': [int(query_handler.ENTITIY2QID['human'][1:])]} # Only direct instances of human
+        for category, tag in query_handler.NER_CATEGORY_MAP:
+            tag2classes[tag] = get_subclass_closure(query_handler.ENTITIY2QID[category])
+        return cls(tag2classes, query_handler.NER_TAG_PRIORITY)
+
+    @classmethod
+    def from_sparql(cls, query_handler, classes_per_query=500, page_size=10000, timeout=90):
+        # Breadth-first search of the subclasses, a level at a time (see above).
+        # The timeout is longer than that of the query service (60s), so that its own timeout error is seen
+        def get_direct_subclasses(class_qids):
+            items = ' '.join('wd:Q%d' % class_qid for class_qid in class_qids)
+            subclasses, offset = set(), 0
+            while True:
+                result = query_handler.get_query_result(DIRECT_SUBCLASSES_QUERY % (items, page_size, offset),
+                                                        method='POST', timeout=timeout)
+                if 'results' not in result:
+                    raise RuntimeError('Failed to get the subclasses of %d classes (like Q%d)' % (len(class_qids), class_qids[0]))
+                bindings = result['results']['bindings']
+                for binding in bindings:
+                    class_uri = binding['class']['value']
+                    if '/Q' in class_uri:
+                        subclasses.add(int(class_uri.rsplit('/Q', 1)[-1]))
+                if len(bindings) < page_size:
+                    return subclasses
+                offset += page_size
+        
+        def get_subclass_closure(category_qid):
+            closure = {int(category_qid[1:])}
+            level, depth = sorted(closure), 0
+            while level:
+                subclasses = set()
+                for class_qids in batched(level, classes_per_query):
+                    subclasses.update(get_direct_subclasses(class_qids))
+                level = sorted(subclasses - closure)
+                closure.update(level)
+                depth += 1
+                print('Subclasses of %s: %d new at depth %d, %d in total' % (category_qid, len(level), depth, len(closure)))
+            return closure
+        return cls.from_closures(query_handler, get_subclass_closure)
+
+    @classmethod
+    def from_dump(cls, dump_handler):
+        def get_subclass_closure(category_qid):
+            return dump_handler.get_subclass_closure(category_qid)
+        return cls.from_closures(dump_handler.query_handler, get_subclass_closure)
+
+    def save(self, index_file):
+        # A JSON header line with the tags & no. of classes, followed by the sorted uint32 class QIDs of each tag
+        header = {'tag_priority': self.tag_priority, 'sizes': {tag: len(classes) for tag, classes in self.tag2classes.items()}}
+        with open(index_file, 'wb') as f:
+            f.write(json.dumps(header).encode('utf-8') + b'\n')
+            for tag in self.tag_priority:
+                array('I', sorted(self.tag2classes[tag])).tofile(f)
+        return
+
+    @classmethod
+    def load(cls, index_file):
+        tag2classes = {}
+        with open(index_file, 'rb') as f:
+            header = json.loads(f.readline())
+            for tag in header['tag_priority']:
+                classes = array('I')
+                classes.fromfile(f, header['sizes'][tag])
+                tag2classes[tag] = classes
+        return cls(tag2classes, header['tag_priority'])
+
+    def classify(self, qid, instance_of):
+        # NER tag of the entity `qid` (say 'Q1001'), given the (int) QIDs of its P31 values
+        qid = int(qid[1:])
+        for tag in self.tag_priority:
+            classes = self.tag2classes[tag]
+            if tag != 'PER' and qid in classes: # The entity itself is a class
+                return tag
+            for class_qid in instance_of:
+                if class_qid in classes:
+                    return tag
+        return None
+
+if __name__ == '__main__':
+    from src.wikidata_sparql import WikiDataQueryHandler
+    index = SubclassIndex.from_sparql(WikiDataQueryHandler())
+    index.save(sys.argv[1])
+    print('Saved the index with %s classes to: %s' % ({tag: len(c) for tag, c in index.tag2classes.items()}, sys.argv[1]))
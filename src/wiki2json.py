@@ -2,70 +2,149 @@
 To process the Wikipedia XML Dump and store the articles (as JSONs) & links.
 
 USAGE:
-$ <script.py> <lang_code> <xml_file> <output_folder>
+$ <script.py> <lang_code> <xml_file> <output_folder> [--index_file <multistream_index>] [--workers N]
+    [--store json|jsonl|sqlite|packed] [--compression none|gzip|zstd]
+
+The XML dump can also be compressed (.bz2, .gz or .xz), it will be streamed as it is read.
 
 EXAMPLE:
 $ python wiki2json.py hi data/hiwiki-20200501-pages-articles-multistream.xml output/hi/
+$ python wiki2json.py hi data/hiwiki-20200501-pages-articles-multistream.xml.bz2 output/hi/ \
+    --index_file data/hiwiki-20200501-pages-articles-multistream-index.txt.bz2
 '''
 
-import os, sys, traceback
+import os, traceback
+import argparse
 from os.path import abspath
+from time import time
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 
 from utils.wiki_dump_reader import Cleaner, iterate
-from utils.file_utils import pretty_write_json, get_verified_path
+from utils.article_store import STORE_TYPES, create_article_store
+from utils.parallel_utils import batched, bounded_map
+
+# One cleaner per (worker) process
+cleaner = Cleaner()
+
+def clean_articles_batch(batch):
+    # Clean each article to get plain-text and links. Returns the results, the time taken & the size of the wikitext
+    start_time = time()
+    results = []
+    num_bytes = 0
+    for title, text in batch:
+        num_bytes += len(text.encode('utf-8'))
+        try:
+            text = cleaner.clean_text(text)
+            cleaned_text, links = cleaner.build_links(text)
+        except:
+            print(traceback.format_exc())
+            print('Failed to parse article:', title)
+            continue
+        results.append((title, cleaned_text, links))
+    return results, time() - start_time, num_bytes
 
 class WikipediaXML2JSON():
-    def __init__(self, wiki_xml, lang_code):
+    def __init__(self, wiki_xml, lang_code, index_file=None):
         self.wiki_xml = wiki_xml
         self.lang_code = lang_code
+        # Multistream index, to decompress the bz2 streams in parallel
+        self.index_file = index_file
+        # No. of articles sent to a cleaning worker at once
+        self.BATCH_SIZE = 64
+        self.reading_time = 0.0
     
-    def process_wiki_xml(self, save_to):
+    def read_articles(self):
+        # Iterate over the XML articles, keeping track of the time spent in reading
+        articles = iterate(self.wiki_xml, self.index_file)
+        while True:
+            start_time = time()
+            article = next(articles, None)
+            self.reading_time += time() - start_time
+            if article is None:
+                return
+            yield article
+    
+    def process_wiki_xml(self, save_to, num_workers=1, store_type='json', **store_options):
         os.makedirs(save_to, exist_ok=True)
         articles_path = os.path.join(save_to, 'articles')
-        os.makedirs(articles_path, exist_ok=True)
-        cleaner = Cleaner()
+        articles_store = create_article_store(articles_path, store_type, **store_options)
         page_titles = set()
-        for title, text in tqdm(iterate(self.wiki_xml), desc='Wikipedia processing', unit=' articles'):
-            # Clean each article to get plain-text and links
-            try:
-                text = cleaner.clean_text(text)
-                cleaned_text, links = cleaner.build_links(text)
-            except:
-                print(traceback.format_exc())
-                print('Failed to parse article:', title)
-                continue
-            
-            # Store article as JSON. Note: 255 is max_path_length for Linux
-            json_path = get_verified_path(articles_path, title, '.json')
-            article = {
-                'title': title,
-                'body': cleaned_text,
-                'links': links,
-                'lang_code': self.lang_code
-            }
-            pretty_write_json(article, json_path)
-            
-            # Save all link names in this article
-            if not cleaned_text.startswith('REDIRECT'):
-                page_titles.add(title.strip())
-            for l in links:
-                entity = l['link'].strip()
-                if entity:
-                    page_titles.add(entity)
+        num_articles, num_bytes, cleaning_time, writing_time = 0, 0, 0.0, 0.0
+        self.reading_time = 0.0
+        
+        executor = ProcessPoolExecutor(num_workers) if num_workers > 1 else None
+        batches = batched(self.read_articles(), self.BATCH_SIZE)
+        if executor:
+            # Results come back in the same order as the XML, so the output is deterministic
+            cleaned_batches = bounded_map(executor, clean_articles_batch, batches, 4*num_workers)
+        else:
+            cleaned_batches = map(clean_articles_batch, batches)
         
+        pool_start_time = time()
+        with tqdm(desc='Wikipedia processing', unit=' articles') as pbar:
+            for results, batch_cleaning_time, batch_bytes in cleaned_batches:
+                cleaning_time += batch_cleaning_time
+                num_bytes += batch_bytes
+                start_time = time()
+                for title, cleaned_text, links in results:
+                    article = {
+                        'title': title,
+                        'body': cleaned_text,
+                        'links': links,
+                        'lang_code': self.lang_code
+                    }
+                    articles_store.write(article)
+                    
+                    # Save all link names in this article
+                    if not cleaned_text.startswith('REDIRECT'):
+                        page_titles.add(title.strip())
+                    for l in links:
+                        entity = l['link'].strip()
+                        if entity:
+                            page_titles.add(entity)
+                writing_time += time() - start_time
+                num_articles += len(results)
+                pbar.update(len(results))
+        
+        pool_time = time() - pool_start_time
+        if executor:
+            executor.shutdown()
+        articles_store.close()
         print('Written all articles to:', articles_path)
+        self.print_throughput(num_articles, num_bytes, num_workers, pool_time, cleaning_time, writing_time)
         
         # Write all the page titles as txt to perform NER later
         entities_txt = os.path.join(save_to, 'page_titles.txt')
         with open(entities_txt, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(page_titles)+'\n')
+            f.write('\n'.join(sorted(page_titles))+'\n')
         
         print('Written %d potential Wiki Entities to:' % len(page_titles), entities_txt)
         return
+    
+    def print_throughput(self, num_articles, num_bytes, num_workers, pool_time, cleaning_time, writing_time):
+        # Note: With workers, reading & writing in the main process overlap with the cleaning.
+        # So the overall rate is measured by the wall-clock time of the whole pool phase
+        print('Overall    : %.1f articles/sec, %.2f MB/sec of wikitext (%.1fs, %d workers)' %
+              (num_articles / max(pool_time, 1e-9), num_bytes / 1e6 / max(pool_time, 1e-9), pool_time, num_workers))
+        print('Throughput per stage (articles/sec):')
+        print('  Reading  : %.1f' % (num_articles / max(self.reading_time, 1e-9)))
+        print('  Cleaning : %.1f per worker' % (num_articles / max(cleaning_time, 1e-9)))
+        print('  Writing  : %.1f' % (num_articles / max(writing_time, 1e-9)))
+        return
         
 if __name__ == '__main__':
-    lang_code, xml_file, output_folder = sys.argv[1:]
-    processor = WikipediaXML2JSON(xml_file, lang_code)
-    processor.process_wiki_xml(output_folder)
+    parser = argparse.ArgumentParser(description='Process the Wikipedia XML Dump to JSON articles')
+    parser.add_argument('lang_code')
+    parser.add_argument('xml_file', help='XML dump, optionally compressed as .bz2, .gz or .xz')
+    parser.add_argument('output_folder')
+    parser.add_argument('--index_file', default=None, help='Multistream index of the .bz2 dump (for parallel decompression)')
+    parser.add_argument('--workers', type=int, default=1, help='No. of processes to clean the articles')
+    parser.add_argument('--store', default='json', choices=sorted(STORE_TYPES), help='How to store the articles')
+    parser.add_argument('--compression', default='none', choices=['none', 'gzip', 'zstd'], help='Compression of the jsonl store')
+    args = parser.parse_args()
+    
+    store_options = {'compression': args.compression} if args.store == 'jsonl' else {}
+    processor = WikipediaXML2JSON(args.xml_file, args.lang_code, args.index_file)
+    processor.process_wiki_xml(args.output_folder, args.workers, args.store, **store_options)
     
\ No newline at end of file
@@ -2,38 +2,64 @@
 To find the NER categories of all the Wikipedia page titles (from a txt file) using WikiData.
 
 USAGE:
-$ <script.py> <lang_code> <txt_file> <output_folder>
+$ <script.py> <lang_code> <txt_file> <output_folder> [<foreign_ner_file>] [--wikidata_dump <json_dump>]
+    [--class_index <index_file>] [--workers <num_threads>] [--resume] [--cache <cache_file>]
+
+With --wikidata_dump, the NER is done offline from a local WikiData JSON dump (.json, .bz2 or .gz).
+The dump has only the canonical titles (sitelinks), so redirects & other non-canonical titles get no QID offline.
+With --class_index, the entities are classified using the precomputed subclasses of each category
+(built & saved to that file if it does not exist: from the dump with --wikidata_dump, else using SPARQL
+level by level, which takes a few thousand queries).
+The QIDs of the titles are found by the worker threads, and their NER categories by a few classifier
+threads, which query the QIDs of many batches of titles together (upto the bulk query size of SPARQL).
+The results are journaled to `ner_journal.jsonl` in the output folder as they come; with --resume,
+the titles already in the journal are not queried again.
+The titles whose lookups failed are not journaled (nor saved), but listed in `ner_failed_titles.txt`,
+so that they are retried with --resume.
+With --cache, the QIDs & NER categories are cached in a SQLite file, which can be shared by the runs
+of all the languages (so that the entities already seen in any language are not queried again).
 
 EXAMPLE:
 $ python wiki2ner.py hi output/hi/page_titles.txt output/hi/
+$ python wiki2ner.py hi output/hi/page_titles.txt output/hi/ --wikidata_dump data/latest-all.json.bz2
 '''
 
 import os, sys
-import json
-import requests
+import argparse
 import traceback
 from threading import Thread
+from queue import Queue, Empty
 from time import sleep
 from tqdm import tqdm
 
 from src.wikidata_sparql import WikiDataQueryHandler
-from utils.file_utils import pretty_write_json
+from src.wikidata_dump import WikiDataDumpHandler
+from src.ner_class_index import SubclassIndex
+from src.ner_cache import NERCache
+from utils.file_utils import write_json, json_dumps, json_loads, iterate_json_dict
+from utils.parallel_utils import batched, SingleFlightCache
+from utils.net_utils import get_http_client
 
 class WikiNER_Downloader():
-    def __init__(self, lang_code):
+    def __init__(self, lang_code, wikipedia_url=None):
         self.lang_code = lang_code
-        self.wikipedia_url = 'https://' + lang_code + '.wikipedia.org'
-        self.wikipedia_pageprops = self.wikipedia_url + '/w/api.php?action=query&titles=%s&redirects&prop=redirects&prop=pageprops&format=json'
+        # The URL can be overridden, say to test against a local server
+        self.wikipedia_url = wikipedia_url or 'https://' + lang_code + '.wikipedia.org'
+        self.wikipedia_api = self.wikipedia_url + '/w/api.php'
+        # MediaWiki API allows upto 50 titles per query
+        self.TITLES_PER_QUERY = 50
+        self.MAX_RETRIES = 3
         self.query_handler = WikiDataQueryHandler()
-        self.qid2category = {}
+        self.http_client = get_http_client()
+        # Concurrent lookups of the same QID (from many workers) wait for a single query
+        self.qid2category = SingleFlightCache(max_size=2000000)
+        # Persistent cache (NERCache) shared with the other runs, if any
+        self.cache = None
     
     def add_foreign_ner(self, ner_file):
         # Save all the QID-to-category maps from any language's NER JSON file
         # so that we might not have to fire duplicate requests.
-        with open(ner_file, encoding='utf-8') as f:
-            ner_data = json.load(f)
-        
-        for entity, data in tqdm(ner_data.items(), desc='Caching NER from file', unit=' entities'):
+        for entity, data in tqdm(iterate_json_dict(ner_file), desc='Caching NER from file', unit=' entities'):
             if 'QID' in data and data['QID']:
                 self.qid2category[data['QID']] = data['NER_Category'] if 'NER_Category' in data else None
         
@@ -45,116 +71,371 @@ class WikiNER_Downloader():
             titles = f.read().split('\n')
         
         ner_data = {}
-        for title in tqdm(titles, desc='Performing NER from WikiData', unit=' entities'):
-            self.fetch_ner_wiki(title, ner_data)
+        with tqdm(total=len(titles), desc='Performing NER from WikiData', unit=' entities') as pbar:
+            for batch in batched(titles, self.TITLES_PER_QUERY):
+                self.fetch_ner_wiki_batch(batch, ner_data)
+                pbar.update(len(batch))
         
         os.makedirs(save_to, exist_ok=True)
+        self.save_failed_titles(titles, ner_data, save_to)
         ner_file = os.path.join(save_to, 'ner_list.json')
-        pretty_write_json(ner_data, ner_file)
+        write_json(ner_data, ner_file)
+        return
+    
+    def load_class_index(self, index_file):
+        # Load the precomputed subclasses of the NER categories, or compute them using SPARQL
+        if os.path.isfile(index_file):
+            class_index = SubclassIndex.load(index_file)
+        else:
+            print('Building the subclass index using SPARQL (level by level, this takes a while)...')
+            class_index = SubclassIndex.from_sparql(self.query_handler)
+            class_index.save(index_file)
+        self.query_handler.class_index = class_index
         return
     
-    def process_titles_parallel(self, txt_file, save_to, num_workers=16):
+    def process_titles_offline(self, txt_file, save_to, wikidata_dump, class_index_file=None):
         # Read list of all page titles
         with open(txt_file, encoding='utf-8') as f:
             titles = f.read().split('\n')
         
-        # Prepare variables for the workers
-        results = [{} for i in range(num_workers)]
-        titles_per_thread = (len(titles)+num_workers) // num_workers
-        threads = []
-        self.threads_counter = [0 for i in range(num_workers)]
+        class_index = None
+        if class_index_file and os.path.isfile(class_index_file):
+            class_index = SubclassIndex.load(class_index_file)
+        dump_handler = WikiDataDumpHandler(self.lang_code, class_index)
+        dump_handler.load_dump(wikidata_dump, titles)
+        if class_index_file and not class_index:
+            dump_handler.class_index.save(class_index_file)
+        ner_data = dump_handler.get_ner_data(titles)
+        
+        os.makedirs(save_to, exist_ok=True)
+        ner_file = os.path.join(save_to, 'ner_list.json')
+        write_json(ner_data, ner_file)
+        return
+    
+    def read_journal(self, journal_file):
+        # Results of all the titles already processed (in a previous run)
+        ner_data = {}
+        if not os.path.isfile(journal_file):
+            return ner_data
+        valid_size = 0
+        with open(journal_file, 'rb') as f:
+            for line in f:
+                try:
+                    title, data = json_loads(line)
+                except ValueError: # Incomplete last line, if the run was killed while writing
+                    break
+                valid_size += len(line)
+                ner_data[title] = data
+                if data['QID']:
+                    self.qid2category[data['QID']] = data.get('NER_Category')
+        # Drop the incomplete line, so that the new results are appended after a complete line
+        os.truncate(journal_file, valid_size)
+        return ner_data
+    
+    def process_titles_parallel(self, txt_file, save_to, num_workers=16, resume=False):
+        # Read list of all page titles
+        with open(txt_file, encoding='utf-8') as f:
+            titles = f.read().split('\n')
+        
+        # Each result is appended to the journal as soon as it is found, so that a killed run can be resumed
+        os.makedirs(save_to, exist_ok=True)
+        journal_file = os.path.join(save_to, 'ner_journal.jsonl')
+        ner_data = self.read_journal(journal_file) if resume else {}
+        if ner_data:
+            print('Resuming with %d titles already processed' % len(ner_data))
+        
+        # Remove duplicate titles, and split into batches which the workers pick up as soon as they are free
+        titles = list(dict.fromkeys(title.replace(' ', '_') for title in titles if title))
+        work_queue = Queue()
+        for batch in batched([title for title in titles if title not in ner_data], self.TITLES_PER_QUERY):
+            work_queue.put(batch)
+        
+        # The results are merged (and journaled) by a single writer, as the classifiers complete each batch
+        result_queue = Queue()
+        writer_thread = Thread(target=self.result_writer, args=(result_queue, ner_data, journal_file, resume))
+        writer_thread.start()
+        
+        # The workers find the QIDs of each batch of titles, and the classifiers their NER categories.
+        # Not more classifiers than the concurrent queries allowed by SPARQL
+        classify_queue = Queue()
+        num_classifiers = min(num_workers, self.query_handler.rate_limit)
+        classifier_threads = []
+        for i in range(num_classifiers):
+            t = Thread(target=self.ner_classifier, args=(classify_queue, result_queue))
+            t.start()
+            classifier_threads.append(t)
         
         # Start all worker threads
+        threads = []
+        self.threads_counter = [0 for i in range(num_workers)]
         for t_id in range(num_workers):
-            t = Thread(target=self.ner_wiki_worker,
-                       args=(t_id, titles[t_id*titles_per_thread : (t_id+1)*titles_per_thread], results[t_id]))
+            work_queue.put(None) # To stop the worker
+            t = Thread(target=self.ner_wiki_worker, args=(t_id, work_queue, classify_queue))
             t.start()
             threads.append(t)
         
         # Start the status printing thread
         self.print_worker_status = True
-        printer_thread = Thread(target=self.worker_status_printer, args=(num_workers,))
+        printer_thread = Thread(target=self.worker_status_printer, args=(num_workers,), daemon=True)
         printer_thread.start()
         
         # Wait till all threads are complete
         for t_id in range(num_workers):
             threads[t_id].join()
+        for t in classifier_threads:
+            classify_queue.put(None) # To stop the classifier
+        for t in classifier_threads:
+            t.join()
+        result_queue.put(None)
+        writer_thread.join()
         
         self.print_worker_status = False
+        self.print_rate_limit_stats()
+        self.save_failed_titles(titles, ner_data, save_to)
+        # Same order as the titles, irrespective of which worker finished first
+        ner_data = {title: ner_data[title] for title in titles if title in ner_data}
         
-        ner_data = {}
-        for t_id in range(num_workers):
-            ner_data.update(results[t_id])
-        
-        os.makedirs(save_to, exist_ok=True)
         ner_file = os.path.join(save_to, 'ner_list.json')
         print('Workers completed the work. Saving to:', ner_file)
-        pretty_write_json(ner_data, ner_file)
+        write_json(ner_data, ner_file)
         return
     
+    def save_failed_titles(self, titles, ner_data, save_to):
+        # List the titles which are not in the results, since their lookups failed (even after the retries)
+        failed_titles = [title for title in titles if title and title.replace(' ', '_') not in ner_data]
+        failed_file = os.path.join(save_to, 'ner_failed_titles.txt')
+        if not failed_titles:
+            if os.path.isfile(failed_file): # From a previous run
+                os.remove(failed_file)
+            return
+        print('Failed to find the NER of %d titles (listed in %s). Run again with --resume to retry them' % (len(failed_titles), failed_file))
+        with open(failed_file, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(failed_titles) + '\n')
+        return
+    
+    def result_writer(self, result_queue, ner_data, journal_file, append=False):
+        # Collect the results of each batch from the workers
+        with open(journal_file, 'a' if append else 'w', encoding='utf-8') as journal:
+            while True:
+                wiki_entities = result_queue.get()
+                if wiki_entities is None:
+                    return
+                ner_data.update(wiki_entities)
+                for title, data in wiki_entities.items():
+                    journal.write(json_dumps([title, data]) + '\n')
+                journal.flush()
+    
     def worker_status_printer(self, num_workers):
-        # TODO: Save NER data once in a while?
         while self.print_worker_status:
             # print('\n\n%5s\t%s' % ('T_ID', 'COUNTER'))
             # for t_id in range(num_workers):
             #     print('%5d\t%d' % (t_id, self.threads_counter[t_id]))
             print('TOTAL PROCESSED -->', sum(self.threads_counter))
+            self.print_rate_limit_stats()
             sleep(1*60)
         return
         
-    def ner_wiki_worker(self, t_id, titles, wiki_entities):
-        for title in titles:
-            self.fetch_ner_wiki(title, wiki_entities)
-            self.threads_counter[t_id] += 1
+    def print_rate_limit_stats(self):
+        stats = self.query_handler.get_rate_limit_stats()
+        print('SPARQL QUERIES --> %d (%.1f%% throttled), avg. wait: %.2fs, max. wait: %.2fs' % (
+            stats['requests'], 100 * stats['throttled_rate'], stats['avg_wait_time'], stats['max_wait_time']))
         return
+    
+    def ner_wiki_worker(self, t_id, work_queue, classify_queue):
+        # Find the QIDs of the batches from the queue, till a None is found. The classifiers do the rest.
+        # The titles of a batch which failed are left out, and reported as failed in the end
+        while True:
+            batch = work_queue.get()
+            if batch is None:
+                return
+            title2qid = {}
+            try:
+                title2qid = self.fetch_qids_batch(batch)
+            except:
+                print(traceback.format_exc())
+            classify_queue.put(title2qid)
+            self.threads_counter[t_id] += len(batch)
+    
+    def ner_classifier(self, classify_queue, result_queue):
+        # Find the NER categories of the titles from the workers, till a None is found.
+        # All the batches waiting in the queue are taken together (till there are enough new entities
+        # for a bulk query), so that the entities of many batches are classified in a few big queries
+        stop = False
+        while not stop:
+            title2qid = classify_queue.get()
+            if title2qid is None:
+                return
+            new_qids = set(qid for qid in title2qid.values() if qid and qid not in self.qid2category)
+            while len(new_qids) < self.query_handler.bulk_query_size:
+                try:
+                    more_title2qid = classify_queue.get_nowait()
+                except Empty:
+                    break
+                if more_title2qid is None:
+                    stop = True
+                    break
+                title2qid.update(more_title2qid)
+                new_qids.update(qid for qid in more_title2qid.values() if qid and qid not in self.qid2category)
+            
+            wiki_entities = {}
+            try:
+                self.classify_titles(title2qid, wiki_entities)
+            except:
+                print(traceback.format_exc())
+            result_queue.put(wiki_entities)
         
     def fetch_ner_wiki(self, page_title, wiki_entities):
-        page_title = page_title.replace(' ', '_')
-        
-        # Find WikiData QID for the Wikipedia Article
-        qid = self.get_qid(page_title)
-        wiki_entities[page_title] = {'QID': qid}
+        return self.fetch_ner_wiki_batch([page_title], wiki_entities)[0]
+    
+    def fetch_ner_wiki_batch(self, page_titles, wiki_entities):
+        # Returns if each title has a NER category. The titles whose lookups failed are not added to `wiki_entities`
+        page_titles = [page_title.replace(' ', '_') for page_title in page_titles]
+        self.classify_titles(self.fetch_qids_batch(page_titles), wiki_entities)
+        return ['NER_Category' in wiki_entities.get(page_title, {}) for page_title in page_titles]
+    
+    def fetch_qids_batch(self, page_titles):
+        # Find WikiData QIDs for the Wikipedia Articles. Returns a map of each title to its QID, in the same order
+        # (without the titles which failed to be queried)
+        page_titles = [page_title.replace(' ', '_') for page_title in page_titles]
+        qids = self.cache.get_qids(self.lang_code, page_titles) if self.cache else {}
+        missing_titles = [page_title for page_title in page_titles if page_title not in qids]
+        if missing_titles:
+            new_qids = self.get_qids(missing_titles)
+            qids.update(new_qids)
+            if self.cache:
+                self.cache.put_qids(self.lang_code, {title: qid for title, qid in new_qids.items() if qid})
+        return {page_title: qids[page_title] for page_title in page_titles if page_title in qids}
+    
+    def classify_titles(self, title2qid, wiki_entities):
+        # Find NER categories of all the new entities at once
+        qid2category = self.qid2category.get_many(sorted(set(qid for qid in title2qid.values() if qid)), self.fetch_ner_categories)
+        return [self.add_ner_category(page_title, qid, wiki_entities, qid2category) for page_title, qid in title2qid.items()]
+    
+    def fetch_ner_categories(self, qids):
+        # NER categories of the entities which are not in memory, from the persistent cache or WikiData.
+        # The entities which failed to be queried are left out, so that they are neither cached here nor in memory
+        qid2category = self.cache.get_categories(qids) if self.cache else {}
+        new_qids = [qid for qid in qids if qid not in qid2category]
+        if new_qids:
+            new_qid2category = self.query_handler.get_ner_categories(new_qids)
+            qid2category.update(new_qid2category)
+            if self.cache:
+                self.cache.put_categories(new_qid2category)
+        return qid2category
+    
+    def add_ner_category(self, page_title, qid, wiki_entities, qid2category=None):
+        # Returns if the title has a NER category. It is not added to `wiki_entities` if the lookup failed
         if not qid:
+            wiki_entities[page_title] = {'QID': qid}
             return False
         
-        # Check if already cached
-        if qid in self.qid2category:
-            if self.qid2category[qid]:
-                wiki_entities[page_title]['NER_Category'] = self.qid2category[qid]
-                return True
-            return False
-        
-        # Find NER category for that entity from WikiData using QID
-        ner_category = self.query_handler.get_ner_category(qid)
-        self.qid2category[qid] = ner_category # I think it's thread-safe
+        # Find NER category for that entity from WikiData using QID, if not already cached
+        if qid2category is not None:
+            if qid not in qid2category: # Failed to query
+                return False
+            ner_category = qid2category[qid]
+        else:
+            try:
+                ner_category = self.qid2category.get(qid, self.query_handler.get_ner_category)
+            except (RuntimeError, KeyError):
+                print(traceback.format_exc())
+                return False
+        wiki_entities[page_title] = {'QID': qid}
         if not ner_category:
             return False
         wiki_entities[page_title]['NER_Category'] = ner_category
         return True
     
     def get_qid(self, page_title):
-        try:
-            response = requests.get(self.wikipedia_pageprops % page_title, timeout=5)
-            pages = response.json()['query']['pages']
-            qids = []
-            for page in pages:
-                if 'pageprops' in pages[page]:
-                    qids.append(pages[page]['pageprops']['wikibase_item'])
+        return self.get_qids([page_title]).get(page_title)
+    
+    def get_qids(self, page_titles):
+        # Find the QIDs of the given titles, querying for upto 50 titles at once.
+        # Returns a map of each title to its QID (None if it has none). The titles which failed are left out
+        title2qid = {}
+        for batch in batched(page_titles, self.TITLES_PER_QUERY):
+            pending = [title for title in batch if title]
+            for i in range(self.MAX_RETRIES):
+                if not pending:
+                    break
+                resolved = self.query_qids(pending)
+                title2qid.update(resolved)
+                # Retry only the titles missing in the response
+                pending = [title for title in pending if title not in resolved]
             
-            return qids[0] if qids else None
+            for title in pending:
+                print('Wikipedia Query for %s failed' % title)
+            if '' in batch:
+                title2qid[''] = None
+        return title2qid
+    
+    def query_qids(self, page_titles):
+        # Run a single query for the given titles. Returns QIDs of all the titles answered in the response
+        params = {
+            'action': 'query',
+            'titles': '|'.join(page_titles),
+            'redirects': 1,
+            'prop': 'pageprops',
+            'ppprop': 'wikibase_item',
+            'format': 'json',
+        }
+        try: # POST, since 50 long titles might not fit into a URL
+            response = self.http_client.post(self.wikipedia_api, data=params, timeout=10,
+                                             headers=self.query_handler.HTTP_REQUEST_HEADER)
+            query = response.json()['query']
         except:
             # print(traceback.format_exc())
-            print('Wikipedia Query for %s failed' % page_title)
-            return None
+            return {}
+        
+        # Map the titles to how the API has renamed them
+        renamed = {}
+        for key in ['normalized', 'converted', 'redirects']:
+            for mapping in query.get(key, []):
+                renamed[mapping['from']] = mapping['to']
+        
+        page2qid = {}
+        for page in query.get('pages', {}).values():
+            if 'title' in page:
+                page2qid[page['title']] = page.get('pageprops', {}).get('wikibase_item')
+        
+        title2qid = {}
+        for title in page_titles:
+            final_title = title
+            for i in range(len(renamed)+1): # Follow the renames, if any (without looping forever)
+                if final_title not in renamed:
+                    break
+                final_title = renamed[final_title]
+            if final_title in page2qid:
+                title2qid[title] = page2qid[final_title]
+        return title2qid
         
 if __name__ == '__main__':
-    lang_code = sys.argv[1]
-    txt_file = sys.argv[2]
-    output_folder = sys.argv[3]
+    parser = argparse.ArgumentParser(description='Find NER categories of Wikipedia titles using WikiData')
+    parser.add_argument('lang_code')
+    parser.add_argument('txt_file')
+    parser.add_argument('output_folder')
+    parser.add_argument('foreign_ner_file', nargs='?', default=None, help='NER file of any other language, to reuse')
+    parser.add_argument('--wikidata_dump', default=None, help='Local WikiData JSON dump, for offline NER. Only the canonical titles are found '
+                        '(redirects are not followed, unlike online), the rest get no QID')
+    parser.add_argument('--class_index', default=None, help='File of the precomputed subclasses of NER categories. '
+                        'If missing, built from the dump (with --wikidata_dump), or else using paged SPARQL queries (slow)')
+    parser.add_argument('--workers', type=int, default=16, help='No. of threads to query with')
+    parser.add_argument('--resume', action='store_true', help='Skip the titles already done in the previous run')
+    parser.add_argument('--cache', default=None, help='SQLite file to cache the QIDs & categories across runs')
+    parser.add_argument('--cache_ttl', type=float, default=90, help='Days after which the cached entries are queried again')
+    args = parser.parse_args()
+    
+    processor = WikiNER_Downloader(args.lang_code)
+    if args.wikidata_dump:
+        processor.process_titles_offline(args.txt_file, args.output_folder, args.wikidata_dump, args.class_index)
+        sys.exit()
+    if args.class_index:
+        processor.load_class_index(args.class_index)
+    if args.cache:
+        processor.cache = NERCache(args.cache, args.cache_ttl)
     
-    processor = WikiNER_Downloader(lang_code)
-    if len(sys.argv) > 4:
-        processor.add_foreign_ner(sys.argv[4])
+    if args.foreign_ner_file:
+        processor.add_foreign_ner(args.foreign_ner_file)
     
-    # processor.process_titles_serial(txt_file, output_folder)
-    processor.process_titles_parallel(txt_file, output_folder)
+    # processor.process_titles_serial(args.txt_file, args.output_folder)
+    processor.process_titles_parallel(args.txt_file, args.output_folder, args.workers, args.resume)
@@ -0,0 +1,131 @@
+'''
+Offline NER using a local WikiData JSON dump (instead of the SPARQL end-point).
+
+The dump (latest-all.json.bz2 or .gz from dumps.wikimedia.org/wikidatawiki/entities/) is streamed once.
+Only the `subclass of` (P279) edges of all classes, and the `instance of` (P31) values of the
+entities having a Wikipedia page in the required language are kept, as compact integer arrays.
+
+USAGE:
+$ <script.py> <lang_code> <wikidata_dump> <title> [<title> ...]
+'''
+
+import sys
+import json
+from array import array
+from bisect import bisect_left, bisect_right
+from tqdm import tqdm
+
+from src.wikidata_sparql import WikiDataQueryHandler
+from src.ner_class_index import SubclassIndex
+from utils.wiki_dump_reader.loader import open_dump
+from utils.file_utils import json_loads
+
+def qid_to_int(qid):
+    return int(qid[1:])
+
+def get_claim_ids(entity, pid):
+    # QIDs which are the values of the given property
+    ids = []
+    for claim in entity.get('claims', {}).get(pid, []):
+        try:
+            ids.append(qid_to_int(claim['mainsnak']['datavalue']['value']['id']))
+        except (KeyError, TypeError, ValueError):
+            continue # No value/unknown value
+    return ids
+
+class WikiDataDumpHandler():
+    def __init__(self, lang_code, class_index=None):
+        self.lang_code = lang_code
+        self.site_key = lang_code + 'wiki'
+        # Reuse the categories (and their QIDs) of the SPARQL handler
+        self.query_handler = WikiDataQueryHandler()
+        # Precomputed SubclassIndex. If not given, it is built from the dump
+        self.class_index = class_index
+
+        # Edges of `subclass of` packed as (parent << 32 | child), sorted after loading
+        self.subclass_edges = array('Q')
+        # Entities of the required titles
+        self.title2qid = {}
+        self.qid2instance_of = {}
+        self.subclass_closures = {}
+
+    def load_dump(self, dump_file, titles):
+        # Stream the dump once, keeping only what is needed to classify the given titles
+        titles = set(title.replace(' ', '_') for title in titles)
+        site_key = ('"%s"' % self.site_key).encode('utf-8')
+        with open_dump(dump_file, binary=True) as reader:
+            for line in tqdm(reader, desc='Reading WikiData dump', unit=' entities'):
+                # Parse only the lines which might be useful
+                has_subclasses = self.class_index is None and b'"P279"' in line
+                has_sitelink = site_key in line
+                if not has_subclasses and not has_sitelink:
+                    continue
+                line = line.strip().rstrip(b',')
+                try:
+                    entity = json_loads(line)
+                except ValueError:
+                    continue
+                if entity.get('type') != 'item':
+                    continue
+                qid = qid_to_int(entity['id'])
+
+                if has_subclasses:
+                    for parent in get_claim_ids(entity, 'P279'):
+                        self.subclass_edges.append(parent << 32 | qid)
+
+                sitelink = entity.get('sitelinks', {}).get(self.site_key)
+                if sitelink:
+                    title = sitelink['title'].replace(' ', '_')
+                    if title in titles:
+                        self.title2qid[title] = entity['id']
+                        self.qid2instance_of[qid] = array('I', get_claim_ids(entity, 'P31'))
+
+        self.subclass_edges = array('Q', sorted(self.subclass_edges))
+        self.subclass_closures = {}
+        if self.class_index is None:
+            self.class_index = SubclassIndex.from_dump(self)
+            # The graph is not needed anymore
+            self.subclass_edges, self.subclass_closures = array('Q'), {}
+        return
+
+    def get_subclass_closure(self, class_qid):
+        # Set of all classes which are (transitively) a subclass of the given class, including itself
+        if class_qid in self.subclass_closures:
+            return self.subclass_closures[class_qid]
+        root = qid_to_int(class_qid)
+        closure, queue = {root}, [root]
+        while queue:
+            parent = queue.pop()
+            # Edges of this parent are contiguous, since sorted by the parent
+            begin = bisect_left(self.subclass_edges, parent << 32)
+            end = bisect_right(self.subclass_edges, parent << 32 | 0xFFFFFFFF)
+            for edge in self.subclass_edges[begin:end]:
+                child = edge & 0xFFFFFFFF
+                if child not in closure:
+                    closure.add(child)
+                    queue.append(child)
+        self.subclass_closures[class_qid] = closure
+        return closure
+
+    def get_ner_category(self, qid):
+        # Same as `?item wdt:P31*/wdt:P279* wd:category`, with atmost one P31 hop
+        return self.class_index.classify(qid, self.qid2instance_of.get(qid_to_int(qid), ()))
+
+    def get_ner_data(self, titles):
+        # NER data of the titles in the same format as `ner_list.json`
+        wiki_entities = {}
+        for title in titles:
+            title = title.replace(' ', '_')
+            qid = self.title2qid.get(title)
+            wiki_entities[title] = {'QID': qid}
+            if qid:
+                ner_category = self.get_ner_category(qid)
+                if ner_category:
+                    wiki_entities[title]['NER_Category'] = ner_category
+        return wiki_entities
+
+if __name__ == '__main__':
+    lang_code, dump_file, titles = sys.argv[1], sys.argv[2], sys.argv[3:]
+    handler = WikiDataDumpHandler(lang_code)
+    handler.load_dump(dump_file, titles)
+    print(json.dumps(handler.get_ner_data(titles), ensure_ascii=False, indent=4))
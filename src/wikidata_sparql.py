@@ -3,20 +3,30 @@ Code to run WikiData Queries for NER.
 
 Note: WikiData's hosted SPARQL service has a rate-limit of 5 concurrent queries per IP.
 Ensur you comply with that to avoid error 429. Src: stackoverflow.com/a/42590757
+All the queries go through the shared RateLimiter of the SPARQL host (see utils/net_utils.py).
 '''
 
 import requests
 import traceback
 from time import sleep
 import random
-import threading
+from urllib.parse import urlsplit
+
+from utils.net_utils import get_http_client
+
+# Why a query failed
+QUERY_TIMEOUT = 'timeout'     # Timed out (or a server error), probably too heavy. Retry with fewer entities
+QUERY_THROTTLED = 'throttled' # Error 429. Retry as it is, after the backoff of the rate-limiter
+QUERY_FAILED = 'failed'       # Any other error
 
 class WikiDataQueryHandler:
-    def __init__(self, rate_limit=5):
+    def __init__(self, rate_limit=5, requests_per_second=5):
         self.rate_limit = rate_limit
-        self.rate_limit_lock = threading.Semaphore(rate_limit)
-        self.retry_after_lock = threading.Lock()
+        self.http_client = get_http_client()
         self.SPARQL_URL = 'https://query.wikidata.org/sparql'
+        # Shared by all the handlers (and threads) in this process
+        self.rate_limiter = self.http_client.set_rate_limit(urlsplit(self.SPARQL_URL).netloc,
+                                                            rate_limit, requests_per_second)
         
         # Get a property of an entity. Args: (qid, pid)
         self.WIKIDATA_GET_CLAIM_API = 'https://www.wikidata.org/w/api.php?action=wbgetclaims&entity=%s&property=%s&props=&format=json'
@@ -45,65 +55,104 @@ class WikiDataQueryHandler:
                 ?item wdt:P31*/wdt:P279* wd:%s .
             }}'''
         
+        # Returns the NER tags of all the given entities (which have one), in a single query.
+        # Args: (space-separated entity QIDs, wd:QID of human, space-separated `(wd:category_qid "TAG")`s)
+        self.BULK_NER_CATEGORY_QUERY = '''
+            SELECT DISTINCT ?item ?tag
+            WHERE {
+                VALUES ?item { %s }
+                {
+                    ?item wdt:P31 %s .
+                    BIND("PER" AS ?tag)
+                } UNION {
+                    VALUES (?category ?tag) { %s }
+                    ?item wdt:P31*/wdt:P279* ?category .
+                }
+            }'''
+        # Returns the `instance of` classes of all the given entities. Args: (space-separated entity QIDs)
+        self.INSTANCE_OF_QUERY = '''
+            SELECT ?item ?class
+            WHERE {
+                VALUES ?item { %s }
+                ?item wdt:P31 ?class .
+            }'''
+        # Precomputed SubclassIndex (see ner_class_index.py). If set, the entities are classified
+        # only by their `instance of` classes, without evaluating the property paths.
+        self.class_index = None
+        
+        # Tags in the order of preference, if an entity has many
+        self.NER_TAG_PRIORITY = ['PER'] + [tag for category, tag in self.NER_CATEGORY_MAP]
+        
+        # No. of entities per bulk query. Halved on timeouts (not on error 429) & slowly grown back on success
+        self.bulk_query_size = 200
+        self.MAX_BULK_QUERY_SIZE = 500
+        
         self.HTTP_REQUEST_HEADER = {'User-agent': 'IndicNLP Bot 0.4'}
         self.MAX_RETRIES = 5
         
-    def send_request_critical_section(self, query):
-        
+    def send_request_critical_section(self, query, method='GET', timeout=20):
+        # The rate-limiter waits for a free slot (and during the backoff after any error 429).
+        # Retries are done by the callers (like `get_query_result`), so that they are also rate-limited
+        if method == 'POST': # For long queries
+            return self.http_client.post(self.SPARQL_URL, data={'format': 'json', 'query': query},
+                                         headers=self.HTTP_REQUEST_HEADER, timeout=timeout, retries=0)
+        return self.http_client.get(self.SPARQL_URL, params={'format': 'json', 'query': query},
+                                    headers=self.HTTP_REQUEST_HEADER, timeout=timeout, retries=0)
+    
+    def get_rate_limit_stats(self):
+        # No. of queries, fraction of them throttled (error 429), and time spent waiting for the rate-limiter
+        return self.rate_limiter.get_stats()
+
+    def try_query(self, query, method='GET', timeout=20):
+        # Run the given query on SPARQL once. Returns (result, None), or (None, why it failed)
         try:
-            # Stall if waiting because of error 429
-            if self.retry_after_lock.locked():
-                self.retry_after_lock.acquire()
-                self.retry_after_lock.release()
-            self.rate_limit_lock.acquire()
-            response = requests.get(self.SPARQL_URL, params={'format': 'json', 'query': query},
-                                    headers=self.HTTP_REQUEST_HEADER, timeout=20)
-            self.rate_limit_lock.release()
+            response = self.send_request_critical_section(query, method, timeout)
         except requests.exceptions.Timeout:
-            sleep(2*random.random())
-            self.rate_limit_lock.release()
-            raise
+            return None, QUERY_TIMEOUT
         except:
-            self.rate_limit_lock.release()
-            raise
+            print(traceback.format_exc())
+            return None, QUERY_FAILED
         
-        # Handle too many requests error
-        if response.status_code == 429 and not self.retry_after_lock.locked():
-            self.retry_after_lock.acquire()
-            retry_after = 30
-            if 'Retry-After' in response.headers:
-                retry_after = int(response.headers["Retry-After"])+1
-            elif 'Retry_After' in response.headers:
-                retry_after = int(response.headers["Retry_After"])+1
-            sleep(retry_after)
-            self.retry_after_lock.release()
-        
-        return response
-
-    def get_query_result(self, query):
-        # Run the given query on SPARQL
-        for i in range(self.MAX_RETRIES):
+        if response.status_code == 200:
             try:
-                response = self.send_request_critical_section(query)
-                
-                if response.status_code == 200:
-                    return response.json()
-                print(response.text)
-            except:
-                print(traceback.format_exc())
+                return response.json(), None
+            except ValueError: # Truncated response
+                return None, QUERY_FAILED
+        if response.status_code == 429:
+            return None, QUERY_THROTTLED
+        if response.status_code >= 500:
+            # The query service answers a query which hit its time-limit with an error 500 (or 502/504 from the proxy)
+            return None, QUERY_TIMEOUT
+        print(response.text)
+        return None, QUERY_FAILED
+    
+    def get_query_result(self, query, max_retries=None, method='GET', timeout=20):
+        # Run the given query on SPARQL, retrying on any failure. Returns {} if all the tries failed
+        for i in range(max_retries or self.MAX_RETRIES):
+            result, error = self.try_query(query, method, timeout)
+            if error is None:
+                return result
+            if error == QUERY_TIMEOUT:
+                sleep(2*random.random())
         return {}
     
     def check_if_direct_instance_of(self, qid, target_qid):
-        # Check if entity `qid` is an instance of `target_qid`
+        # Check if entity `qid` is an instance of `target_qid`. Raises RuntimeError if the API could not be queried
         try: # Property P31 means `instance of`
-            response = requests.get(self.WIKIDATA_GET_CLAIM_API % (qid, 'P31'))
-            if target_qid == response.json()['claims']['P31'][0]['mainsnak']['datavalue']['value']['id']:
-                return True
+            response = self.http_client.get(self.WIKIDATA_GET_CLAIM_API % (qid, 'P31'), headers=self.HTTP_REQUEST_HEADER)
+            claims = response.json()['claims']
         except:
-            pass #print(traceback.format_exc())
+            raise RuntimeError('Failed to get the claims of %s' % qid)
+        try:
+            if target_qid == claims['P31'][0]['mainsnak']['datavalue']['value']['id']:
+                return True
+        except (KeyError, IndexError): # No `instance of`
+            pass
         return False
 
     def get_ner_category(self, qid):
+        # NER category of the entity (None if it has none).
+        # Raises RuntimeError if any query failed, so that a failure is not taken as `no category`
         
         # Check if human directly using WikiData API
         if self.check_if_direct_instance_of(qid, self.ENTITIY2QID['human']):
@@ -112,16 +161,77 @@ class WikiDataQueryHandler:
         # Run SPARQL for other categories
         for category, tag in self.NER_CATEGORY_MAP:
             cat_qid = self.ENTITIY2QID[category]
-            try:
-                result = self.get_query_result(self.NER_CATEGORY_QUERY % (qid, cat_qid))
-                if 'results' in result and int(result['results']['bindings'][0]['count']['value']):
-                    return tag # Return the entity category if 1
-            except:
-                print(traceback.format_exc())
+            result = self.get_query_result(self.NER_CATEGORY_QUERY % (qid, cat_qid))
+            if 'results' not in result:
+                raise RuntimeError('Failed to query if %s is a %s' % (qid, category))
+            if int(result['results']['bindings'][0]['count']['value']):
+                return tag # Return the entity category if 1
         return None
+    
+    def get_bulk_ner_categories(self, qids):
+        # Get the NER categories of the given entities in one query.
+        # Returns (qid2category, None), or (None, why it failed) so that the caller can decide how to retry
+        if self.class_index:
+            return self.get_indexed_ner_categories(qids)
+        items = ' '.join('wd:' + qid for qid in qids)
+        categories = ' '.join('(wd:%s "%s")' % (self.ENTITIY2QID[category], tag) for category, tag in self.NER_CATEGORY_MAP)
+        query = self.BULK_NER_CATEGORY_QUERY % (items, 'wd:' + self.ENTITIY2QID['human'], categories)
+        result, error = self.try_query(query, method='POST')
+        if error:
+            return None, error
+        
+        qid2tags = {}
+        for binding in result['results']['bindings']:
+            qid = binding['item']['value'].rsplit('/', 1)[-1]
+            qid2tags.setdefault(qid, set()).add(binding['tag']['value'])
+        
+        qid2category = {}
+        for qid in qids:
+            tags = qid2tags.get(qid, set())
+            qid2category[qid] = next((tag for tag in self.NER_TAG_PRIORITY if tag in tags), None)
+        return qid2category, None
+    
+    def get_indexed_ner_categories(self, qids):
+        # Classify the entities using the `class_index`, by just finding their `instance of` classes
+        result, error = self.try_query(self.INSTANCE_OF_QUERY % ' '.join('wd:' + qid for qid in qids), method='POST')
+        if error:
+            return None, error
+        qid2classes = {}
+        for binding in result['results']['bindings']:
+            qid = binding['item']['value'].rsplit('/', 1)[-1]
+            class_qid = binding['class']['value'].rsplit('/', 1)[-1]
+            if class_qid.startswith('Q'):
+                qid2classes.setdefault(qid, []).append(int(class_qid[1:]))
+        return {qid: self.class_index.classify(qid, qid2classes.get(qid, [])) for qid in qids}, None
+    
+    def get_ner_categories(self, qids):
+        # Get the NER categories of many entities, using as few queries as possible.
+        # The entities which could not be queried are left out (unlike those with no category, which are None)
+        qid2category = {}
+        pending = list(qids)
+        while pending:
+            batch, pending = pending[:self.bulk_query_size], pending[self.bulk_query_size:]
+            for i in range(self.MAX_RETRIES):
+                result, error = self.get_bulk_ner_categories(batch)
+                # On error 429, the rate-limiter holds back all the queries till the backoff is over,
+                # so the same batch is just sent again
+                if error not in [QUERY_THROTTLED, QUERY_FAILED]:
+                    break
+            
+            if result is not None:
+                qid2category.update(result)
+                self.bulk_query_size = min(self.MAX_BULK_QUERY_SIZE, self.bulk_query_size + max(1, self.bulk_query_size // 4))
+            elif error == QUERY_TIMEOUT and len(batch) > 1:
+                # Too heavy. Retry in smaller batches
+                self.bulk_query_size = max(1, len(batch) // 2)
+                pending = batch + pending
+            else:
+                print('SPARQL query failed (%s) for %d entities: %s' % (error, len(batch), ' '.join(batch[:5])))
+        return qid2category
 
 
 if __name__ == '__main__':
     sparql_handler = WikiDataQueryHandler()
     print(sparql_handler.get_ner_category('Q15646407')) # Ensure Kendriya Vidyala school is an organization
     print(sparql_handler.check_if_direct_instance_of('Q1001', 'Q5')) # Ensure Mahatma Gandhi is a human
+    print(sparql_handler.get_ner_categories(['Q15646407', 'Q1001', 'Q668'])) # Bulk: ORG, PER, LOC
@@ -0,0 +1,367 @@
+'''
+Storage backends for the processed Wikipedia articles.
+
+- json   : One compact JSON file per article (the original layout)
+- jsonl  : Compact JSON lines, sharded & optionally compressed (gzip/zstd)
+- sqlite : A single SQLite DB
+- packed : A single packed corpus file with offset indices, memory-mapped for random access by title or sequence no.
+
+All the stores live in a folder. Except for `json`, a manifest file is written to that folder
+on closing the store, so that readers can simply use `open_article_store(folder)`.
+
+To read the store from many processes, `get_batches()` gives small picklable references
+to batches of articles (file names, shards or ranges), which any process can read using `read_batch()`.
+'''
+
+import os
+import json
+import gzip
+import mmap
+import sqlite3
+import traceback
+from glob import glob
+from array import array
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from utils.parallel_utils import batched
+from utils.file_utils import pretty_write_json, write_json, read_json, json_dumps, json_dumps_bytes, json_loads, get_verified_path
+
+MANIFEST_FILE = 'articles_store.json'
+
+def write_manifest(folder, store_type, options, num_articles):
+    manifest = {
+        'store_type': store_type,
+        'options': options,
+        'num_articles': num_articles,
+    }
+    pretty_write_json(manifest, os.path.join(folder, MANIFEST_FILE))
+
+class JSONDirStore():
+    def __init__(self, folder, mode='r'):
+        self.folder = folder
+        if mode == 'w':
+            os.makedirs(folder, exist_ok=True)
+        self.article_files = None
+
+    def write(self, article):
+        # Note: 255 is max_path_length for Linux
+        json_path = get_verified_path(self.folder, article['title'], '.json')
+        write_json(article, json_path)
+
+    def get_article_files(self):
+        if self.article_files is None:
+            self.article_files = sorted(glob(os.path.join(self.folder, '*.json')))
+        return self.article_files
+
+    def __iter__(self):
+        for article_file in self.get_article_files():
+            yield from self.read_batch([article_file])
+
+    def __len__(self):
+        return len(self.get_article_files())
+
+    def get_batches(self, batch_size):
+        return batched(self.get_article_files(), batch_size)
+
+    def read_batch(self, article_files):
+        # The files which cannot be parsed are skipped
+        articles = []
+        for article_file in article_files:
+            try:
+                articles.append(read_json(article_file))
+            except:
+                print(traceback.format_exc())
+                print('Unable to parse:', article_file)
+        return articles
+
+    def get(self, title):
+        json_path = get_verified_path(self.folder, title, '.json')
+        if not os.path.isfile(json_path):
+            return None
+        return read_json(json_path)
+
+    def close(self):
+        return
+
+class JSONLStore():
+    EXTENSIONS = {
+        'none': '.jsonl',
+        'gzip': '.jsonl.gz',
+        'zstd': '.jsonl.zst',
+    }
+
+    def __init__(self, folder, mode='r', compression='none', articles_per_shard=10000):
+        self.folder = folder
+        self.mode = mode
+        self.compression = compression
+        self.articles_per_shard = articles_per_shard
+        if compression not in self.EXTENSIONS:
+            raise ValueError('Unknown compression: %s' % compression)
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError('Please `pip install zstandard` for zstd compression')
+        self.num_articles = 0
+        self.writer = None
+        if mode == 'w':
+            os.makedirs(folder, exist_ok=True)
+            for shard_file in self.get_shard_files():
+                os.remove(shard_file)
+
+    def open_shard(self, shard_file, mode):
+        if self.compression == 'gzip':
+            return gzip.open(shard_file, mode + 't', encoding='utf-8')
+        if self.compression == 'zstd':
+            return zstandard.open(shard_file, mode + 't', encoding='utf-8')
+        return open(shard_file, mode, encoding='utf-8')
+
+    def get_shard_file(self, shard_id):
+        return os.path.join(self.folder, 'articles-%05d%s' % (shard_id, self.EXTENSIONS[self.compression]))
+
+    def get_shard_files(self):
+        return sorted(glob(os.path.join(self.folder, 'articles-*' + self.EXTENSIONS[self.compression])))
+
+    def write(self, article):
+        if self.num_articles % self.articles_per_shard == 0:
+            if self.writer:
+                self.writer.close()
+            self.writer = self.open_shard(self.get_shard_file(self.num_articles // self.articles_per_shard), 'w')
+        self.writer.write(json_dumps(article) + '\n')
+        self.num_articles += 1
+
+    def __iter__(self):
+        for shard_file in self.get_shard_files():
+            yield from self.read_batch(shard_file)
+
+    def get_batches(self, batch_size):
+        # Each shard is a batch, since the lines of a (compressed) shard can only be read in order
+        return iter(self.get_shard_files())
+
+    def read_batch(self, shard_file):
+        with self.open_shard(shard_file, 'r') as f:
+            return [json_loads(line) for line in f]
+
+    def __len__(self):
+        return self.num_articles
+
+    def get(self, title):
+        # Note: Linear scan. Use the `sqlite` or `packed` stores for frequent lookups
+        for article in self:
+            if article['title'] == title:
+                return article
+        return None
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        if self.mode == 'w':
+            options = {'compression': self.compression, 'articles_per_shard': self.articles_per_shard}
+            write_manifest(self.folder, 'jsonl', options, self.num_articles)
+        return
+
+class SQLiteStore():
+    DB_FILE = 'articles.sqlite'
+
+    def __init__(self, folder, mode='r', commit_every=10000):
+        self.folder = folder
+        self.mode = mode
+        self.commit_every = commit_every
+        db_file = os.path.join(folder, self.DB_FILE)
+        if mode == 'w':
+            os.makedirs(folder, exist_ok=True)
+            if os.path.exists(db_file):
+                os.remove(db_file)
+        self.db_file = db_file
+        self.db = sqlite3.connect(db_file)
+        self.pid = os.getpid()
+        if mode == 'w':
+            self.db.execute('PRAGMA journal_mode = OFF')
+            self.db.execute('PRAGMA synchronous = OFF')
+            self.db.execute('CREATE TABLE articles (id INTEGER PRIMARY KEY, title TEXT, data TEXT)')
+        self.num_uncommitted = 0
+
+    def write(self, article):
+        self.db.execute('INSERT INTO articles (title, data) VALUES (?, ?)',
+                        (article['title'], json_dumps(article)))
+        self.num_uncommitted += 1
+        if self.num_uncommitted >= self.commit_every:
+            self.db.commit()
+            self.num_uncommitted = 0
+
+    def get_db(self):
+        # A connection must not be used across a fork, so each reader process opens its own
+        if self.pid != os.getpid():
+            self.db = sqlite3.connect(self.db_file)
+            self.pid = os.getpid()
+        return self.db
+
+    def __iter__(self):
+        for (data,) in self.get_db().execute('SELECT data FROM articles ORDER BY id'):
+            yield json_loads(data)
+
+    def __len__(self):
+        return self.get_db().execute('SELECT COUNT(*) FROM articles').fetchone()[0]
+
+    def get_batches(self, batch_size):
+        # Ranges of the row IDs
+        max_id = self.get_db().execute('SELECT MAX(id) FROM articles').fetchone()[0] or 0
+        return ((begin, begin + batch_size) for begin in range(1, max_id + 1, batch_size))
+
+    def read_batch(self, id_range):
+        rows = self.get_db().execute('SELECT data FROM articles WHERE id >= ? AND id < ? ORDER BY id', id_range)
+        return [json_loads(data) for (data,) in rows]
+
+    def get(self, title):
+        row = self.get_db().execute('SELECT data FROM articles WHERE title = ?', (title,)).fetchone()
+        return json_loads(row[0]) if row else None
+
+    def close(self):
+        if self.db is None:
+            return
+        if self.mode == 'w':
+            self.db.execute('CREATE INDEX title_index ON articles (title)')
+            self.db.commit()
+            write_manifest(self.folder, 'sqlite', {}, len(self))
+        self.db.close()
+        self.db = None
+        return
+
+class PackedStore():
+    """
+    All articles packed in `corpus.bin`, each as compact JSON metadata followed by the raw UTF-8 body.
+    - `corpus.idx` : (offset, metadata_length, body_length) of each article, by sequence no.
+    - `titles.bin` : Sorted lines of `title<TAB>sequence_no`
+    - `titles.idx` : Offset of each line in `titles.bin`, for binary search
+    Readers memory-map these files, so only the accessed articles are ever loaded.
+    """
+    CORPUS_FILE, CORPUS_INDEX_FILE = 'corpus.bin', 'corpus.idx'
+    TITLES_FILE, TITLES_INDEX_FILE = 'titles.bin', 'titles.idx'
+
+    def __init__(self, folder, mode='r'):
+        self.folder = folder
+        self.mode = mode
+        if mode == 'w':
+            os.makedirs(folder, exist_ok=True)
+            self.writer = open(os.path.join(folder, self.CORPUS_FILE), 'wb')
+            self.corpus_index = array('Q')
+            self.titles = []
+        else:
+            self.corpus = self.map_file(self.CORPUS_FILE)
+            self.corpus_index = memoryview(self.map_file(self.CORPUS_INDEX_FILE)).cast('Q')
+            self.titles_data = self.map_file(self.TITLES_FILE)
+            self.titles_index = memoryview(self.map_file(self.TITLES_INDEX_FILE)).cast('Q')
+
+    def map_file(self, filename):
+        with open(os.path.join(self.folder, filename), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def write(self, article):
+        metadata = {key: value for key, value in article.items() if key != 'body'}
+        metadata = json_dumps_bytes(metadata)
+        body = article['body'].encode('utf-8')
+        self.corpus_index.extend([self.writer.tell(), len(metadata), len(body)])
+        self.writer.write(metadata)
+        self.writer.write(body)
+        self.titles.append((article['title'].encode('utf-8'), len(self.titles)))
+
+    def __len__(self):
+        return len(self.corpus_index) // 3
+
+    def get_body_view(self, index):
+        # Zero-copy view of the UTF-8 body of the article at given sequence no.
+        offset, metadata_length, body_length = self.corpus_index[3*index : 3*index+3]
+        return memoryview(self.corpus)[offset+metadata_length : offset+metadata_length+body_length]
+
+    def get_by_index(self, index):
+        offset, metadata_length, body_length = self.corpus_index[3*index : 3*index+3]
+        article = json_loads(self.corpus[offset : offset+metadata_length])
+        article['body'] = str(self.get_body_view(index), 'utf-8')
+        return article
+
+    def find(self, title):
+        # Binary search for the sequence no. of the title
+        title = title.encode('utf-8')
+        num_titles = len(self.titles_index) - 1
+        low, high = 0, num_titles
+        while low < high:
+            mid = (low + high) // 2
+            if self.get_title_line(mid)[0] < title:
+                low = mid + 1
+            else:
+                high = mid
+        if low == num_titles:
+            return None
+        line_title, index = self.get_title_line(low)
+        return index if line_title == title else None
+
+    def get_title_line(self, line_number):
+        line = self.titles_data[self.titles_index[line_number] : self.titles_index[line_number+1]]
+        title, index = line.rstrip(b'\n').rsplit(b'\t', 1)
+        return title, int(index)
+
+    def get(self, title):
+        index = self.find(title)
+        return self.get_by_index(index) if index is not None else None
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.get_by_index(index)
+
+    def get_batches(self, batch_size):
+        # Ranges of the sequence nos. The memory-maps are shared by the forked processes
+        return ((begin, min(begin + batch_size, len(self))) for begin in range(0, len(self), batch_size))
+
+    def read_batch(self, index_range):
+        return [self.get_by_index(index) for index in range(*index_range)]
+
+    def close(self):
+        if self.mode != 'w':
+            return
+        self.writer.close()
+        with open(os.path.join(self.folder, self.CORPUS_INDEX_FILE), 'wb') as f:
+            self.corpus_index.tofile(f)
+        
+        # Titles sorted by their bytes. The index has an extra offset to mark the end of the last line
+        self.titles.sort()
+        titles_index = array('Q', [0])
+        with open(os.path.join(self.folder, self.TITLES_FILE), 'wb') as f:
+            for title, index in self.titles:
+                f.write(b'%s\t%d\n' % (title, index))
+                titles_index.append(f.tell())
+        with open(os.path.join(self.folder, self.TITLES_INDEX_FILE), 'wb') as f:
+            titles_index.tofile(f)
+        
+        write_manifest(self.folder, 'packed', {}, len(self))
+        self.mode = 'r'
+        return
+
+STORE_TYPES = {
+    'json': JSONDirStore,
+    'jsonl': JSONLStore,
+    'sqlite': SQLiteStore,
+    'packed': PackedStore,
+}
+
+def create_article_store(folder, store_type='json', **kwargs):
+    # Open a new store to write the articles to. Close it once done.
+    # The manifest of any earlier store in the folder is removed, so that it is not opened instead of this one.
+    manifest_file = os.path.join(folder, MANIFEST_FILE)
+    if os.path.isfile(manifest_file):
+        os.remove(manifest_file)
+    return STORE_TYPES[store_type](folder, mode='w', **kwargs)
+
+def open_article_store(folder):
+    # Open an existing store of articles, as written by `create_article_store()`
+    manifest_file = os.path.join(folder, MANIFEST_FILE)
+    if not os.path.isfile(manifest_file):
+        return JSONDirStore(folder)
+    with open(manifest_file, encoding='utf-8') as f:
+        manifest = json.load(f)
+    store = STORE_TYPES[manifest['store_type']](folder, mode='r', **manifest['options'])
+    store.num_articles = manifest['num_articles']
+    return store
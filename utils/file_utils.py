@@ -3,6 +3,58 @@ import sys
 import os
 import traceback
 
+# Faster JSON backend, if installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def orjson_dumps(data, sort_keys=False):
+    # Returns None if orjson is not installed or cannot serialize the data (say big ints, which only the stdlib supports)
+    if orjson:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0))
+        except (orjson.JSONEncodeError, TypeError):
+            pass
+    return None
+
+def json_dumps(data, sort_keys=False):
+    # Compact JSON (non-ASCII chars as is). Equivalent JSON with or without orjson,
+    # though the formatting of floats may differ (say 1e-7 vs 1e-07)
+    output = orjson_dumps(data, sort_keys)
+    if output is not None:
+        return output.decode('utf-8')
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), sort_keys=sort_keys)
+
+def json_dumps_bytes(data, sort_keys=False):
+    output = orjson_dumps(data, sort_keys)
+    return output if output is not None else json_dumps(data, sort_keys).encode('utf-8')
+
+def json_loads(text):
+    # From str or bytes
+    if orjson:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass # Say NaN, which only the stdlib supports
+    return json.loads(text)
+
+def read_json(infile):
+    with open(infile, 'rb') as f:
+        return json_loads(f.read())
+
+def write_json(data, outfile, sort_keys=False, pretty=False):
+    # Compact by default, for the files read only by the code. Use `pretty` for the files meant to be read by us
+    if pretty:
+        return pretty_write_json(data, outfile, sort_keys)
+    try:
+        with open(outfile, 'wb') as f:
+            f.write(json_dumps_bytes(data, sort_keys))
+    except:
+        print(traceback.format_exc())
+        print('Failed to save JSON:', outfile)
+    return
+
 def pretty_write_json(data, outfile, sort_keys=False):
     try:
         with open(outfile, 'w', encoding='utf-8') as f:
@@ -12,6 +64,104 @@ def pretty_write_json(data, outfile, sort_keys=False):
         print('Failed to save JSON:', outfile)
     return
 
+class JSONStreamReader():
+    # Decodes a big JSON file value by value, reading only a chunk at a time
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, f):
+        self.f = f
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def read_more(self):
+        chunk = self.f.read(self.CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop what is already decoded
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        # Next non-whitespace char (None at the end of file)
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.read_more():
+                return None
+
+    def expect(self, chars):
+        char = self.peek()
+        if char is None or char not in chars:
+            raise ValueError('Expected %s at %d, found %r' % (' or '.join(chars), self.pos, char))
+        self.pos += 1
+        return char
+
+    def decode(self):
+        # Decode the next value, reading more till it is complete
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number at the end of the buffer might be incomplete
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.read_more()
+
+    def iterate_object(self):
+        # (key, value) pairs of the object starting here
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.decode()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+    def iterate_array(self):
+        # Values of the array starting here
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.decode()
+            if self.expect(',]') == ']':
+                return
+
+def iterate_json_dict(infile):
+    # (key, value) pairs of the top-level JSON object, without loading the whole file (say `ner_list.json`)
+    with open(infile, encoding='utf-8') as f:
+        reader = JSONStreamReader(f)
+        for key in reader.iterate_object():
+            yield key, reader.decode()
+
+def iterate_json_list(infile, key=None):
+    # Items of the top-level JSON list, or of the list at the `key` of the top-level object
+    # (say `cloze_data` of `cloze_dataset.json`), without loading the whole file
+    with open(infile, encoding='utf-8') as f:
+        reader = JSONStreamReader(f)
+        if key is None:
+            yield from reader.iterate_array()
+            return
+        for object_key in reader.iterate_object():
+            if object_key == key:
+                yield from reader.iterate_array()
+                return
+            reader.decode() # Skip the other values
+
 INVALID_FILENAME_CHARS = '<>:"/\\|?*'
 def get_valid_filename(filename):
     # Note: Tested only on Windows
@@ -1,6 +1,7 @@
 '''
 Language Utilities
 '''
+import re
 # TODO: Ensure all languages of the Indian subcontinent is supported
 
 # End of Sentence Full Stops for different language scripts
@@ -19,3 +20,13 @@ EOS_DELIMITERS = {
     'ta': '.',
     'ml': '.'
 }
+
+# Other sentence delimiters, which are often mixed with the full stop of the language
+OTHER_EOS_DELIMITERS = '.?!'
+
+def get_sentence_end_pattern(lang_code):
+    # Matches the end of each sentence. The other delimiters are considered only if followed by a space,
+    # so that the decimal points and such are not mistaken for the end of a sentence.
+    full_stop = EOS_DELIMITERS[lang_code]
+    others = ''.join(delimiter for delimiter in OTHER_EOS_DELIMITERS if delimiter != full_stop)
+    return re.compile('%s|[%s](?=\\s|$)' % (re.escape(full_stop), re.escape(others)))
@@ -1,28 +1,248 @@
-from threading import Thread
-from requests import get
-from time import sleep
+'''
+Shared HTTP client for all the WikiData/Wikipedia requests.
+
+A single `requests.Session` keeps the connections alive and pooled (so no new TCP+TLS handshake per request),
+the requests to each host go through its `RateLimiter`, and failed requests (connection errors, 429 & 5xx)
+are retried with exponential backoff, honoring the server's `Retry-After` header.
+
+The async API runs the requests on a small bounded executor (sharing the same pool of connections),
+and `multi_get` is the sync facade over it.
+'''
+
+import asyncio
+import random
+import threading
+from time import sleep, monotonic
+from urllib.parse import urlsplit
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 
-class URLThread(Thread):
-    def __init__(self, url, timeout):
-        super(URLThread, self).__init__()
-        self.url = url
-        self.response = None
-        self.max_timeout = timeout if timeout else None
-        # TODO: Implement retries?
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+def parse_retry_after(value):
+    # `Retry-After` is either the no. of seconds, or a HTTP date. Returns seconds (None if invalid)
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+class RateLimiter():
+    # Limits the requests to a host by:
+    #  - No. of concurrent requests
+    #  - Requests per second (token bucket, allowing bursts of upto `burst` requests)
+    #  - A global backoff window (say on error 429), during which no new request is started
+    def __init__(self, max_concurrent=5, requests_per_second=None, burst=None):
+        self.max_concurrent = max_concurrent
+        self.requests_per_second = requests_per_second
+        self.burst = burst or max(1, int(requests_per_second or 1))
+        self.condition = threading.Condition()
+        self.active = 0
+        self.tokens = self.burst
+        self.last_refill = monotonic()
+        self.blocked_until = 0.0
+        
+        # Metrics
+        self.num_requests = 0
+        self.num_throttled = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+    
+    def refill(self, now):
+        if self.requests_per_second:
+            self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.requests_per_second)
+        self.last_refill = now
+    
+    def acquire(self):
+        start = monotonic()
+        with self.condition:
+            while True:
+                now = monotonic()
+                self.refill(now)
+                if now < self.blocked_until:
+                    self.condition.wait(self.blocked_until - now)
+                elif self.active >= self.max_concurrent:
+                    self.condition.wait()
+                elif self.requests_per_second and self.tokens < 1:
+                    self.condition.wait((1 - self.tokens) / self.requests_per_second)
+                else:
+                    break
+            if self.requests_per_second:
+                self.tokens -= 1
+            self.active += 1
+            self.num_requests += 1
+            wait_time = monotonic() - start
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+        return
+    
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+        return
+    
+    def __enter__(self):
+        self.acquire()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.release()
+    
+    def backoff(self, seconds, throttled=True):
+        # Stop all the new requests for the given time (extending the current window, if any)
+        with self.condition:
+            self.blocked_until = max(self.blocked_until, monotonic() + seconds)
+            if throttled:
+                self.num_throttled += 1
+            self.condition.notify_all()
+        return
+    
+    def get_stats(self):
+        with self.condition:
+            return {
+                'requests': self.num_requests,
+                'throttled': self.num_throttled,
+                'throttled_rate': self.num_throttled / max(1, self.num_requests),
+                'avg_wait_time': self.total_wait_time / max(1, self.num_requests),
+                'max_wait_time': self.max_wait_time,
+            }
+
+class HTTPClient():
+    def __init__(self, max_connections=32, per_host_limit=8, max_retries=3, backoff=1.0,
+                 max_backoff=60, timeout=20, headers=None):
+        self.MAX_RETRIES = max_retries
+        self.BACKOFF = backoff
+        self.MAX_BACKOFF = max_backoff
+        self.TIMEOUT = timeout
+        self.PER_HOST_LIMIT = per_host_limit
+        self.MAX_CONNECTIONS = max_connections
+        # Backoff on error 429, if the server does not say how long to wait
+        self.DEFAULT_RETRY_AFTER = 30
+
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        # Retries are done here (to honor Retry-After), not by urllib3
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections,
+                              max_retries=0, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.rate_limiters = {}
+        self.rate_limiters_lock = threading.Lock()
+        self.executor = None
+        self.executor_lock = threading.Lock()
+
+    def get_rate_limiter(self, url):
+        # Rate limiter of the URL's host. By default, only the concurrent requests are limited
+        host = urlsplit(url).netloc or url
+        with self.rate_limiters_lock:
+            if host not in self.rate_limiters:
+                self.rate_limiters[host] = RateLimiter(self.PER_HOST_LIMIT)
+            return self.rate_limiters[host]
+    
+    def set_rate_limit(self, host, max_concurrent, requests_per_second=None, burst=None):
+        # Set the limits of a host (say `query.wikidata.org`). Returns its RateLimiter
+        with self.rate_limiters_lock:
+            limiter = self.rate_limiters.get(host)
+            if limiter and (limiter.max_concurrent, limiter.requests_per_second) == (max_concurrent, requests_per_second):
+                return limiter
+            self.rate_limiters[host] = RateLimiter(max_concurrent, requests_per_second, burst)
+            return self.rate_limiters[host]
+
+    def get_backoff(self, attempt, response=None):
+        # Time to wait before the next attempt
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                return min(retry_after, self.MAX_BACKOFF)
+        # Exponential backoff with jitter, so that the workers do not retry in lock-step
+        return min(self.BACKOFF * (2 ** attempt), self.MAX_BACKOFF) * (0.5 + random.random() / 2)
+
+    def request(self, method, url, retries=None, **kwargs):
+        # Send a request, retrying on failures. Returns the last response (or raises the last exception)
+        retries = self.MAX_RETRIES if retries is None else retries
+        kwargs.setdefault('timeout', self.TIMEOUT)
+        rate_limiter = self.get_rate_limiter(url)
+        for attempt in range(retries + 1):
+            response = None
+            try:
+                with rate_limiter:
+                    response = self.session.request(method, url, **kwargs)
+                if response.status_code == 429:
+                    # Every request to this host waits, not just this one
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    rate_limiter.backoff(min(self.DEFAULT_RETRY_AFTER if retry_after is None else retry_after,
+                                             self.MAX_BACKOFF))
+                if response.status_code not in RETRY_STATUS_CODES or attempt == retries:
+                    return response
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt == retries:
+                    raise
+            if response is None or response.status_code != 429:
+                sleep(self.get_backoff(attempt, response))
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def get_executor(self):
+        # The blocking requests of the async API run here; no more threads than the pooled connections
+        with self.executor_lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(self.MAX_CONNECTIONS, thread_name_prefix='http')
+            return self.executor
+
+    async def async_request(self, method, url, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.get_executor(), lambda: self.request(method, url, **kwargs))
+
+    async def async_get(self, url, **kwargs):
+        return await self.async_request('GET', url, **kwargs)
+
+    async def async_get_all(self, urls, **kwargs):
+        # Returns (url, response) for all the URLs, in order. The response is None if the request failed
+        async def get_or_none(url):
+            try:
+                return url, await self.async_get(url, **kwargs)
+            except Exception:
+                return url, None
+        return await asyncio.gather(*[get_or_none(url) for url in urls])
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown()
+        self.session.close()
+
+# Client shared by all the modules
+default_client = None
+default_client_lock = threading.Lock()
 
-    def run(self):
-        self.response = get(self.url, timeout=self.max_timeout)
+def get_http_client():
+    global default_client
+    with default_client_lock:
+        if default_client is None:
+            default_client = HTTPClient()
+        return default_client
 
 def multi_get(uris, timeout=0.0):
-    # Inspired: github.com/divkakwani/webcorpus/blob/master/webcorpus/processors/headline-pred.py#L38
-    threads = [URLThread(uri, timeout) for uri in uris]
-    for thread in threads:
-        thread.start()
-    for thread in threads:
-        thread.join()
-    
-    return [(x.url, x.response) for x in threads]
+    # Fetch all the URIs concurrently. Returns (uri, response) pairs, with None for failed requests
+    kwargs = {'timeout': timeout} if timeout else {}
+    return asyncio.run(get_http_client().async_get_all(uris, **kwargs))
 
 def multi_get_batch(uris, batch_size, timeout=0.0):
     num_batches = (len(uris) + batch_size) // batch_size
@@ -0,0 +1,101 @@
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import Future
+from itertools import islice
+
+def batched(iterable, batch_size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def bounded_map(executor, fn, iterable, max_pending):
+    # Like executor.map(), but submits lazily so that only `max_pending` inputs/results are in memory.
+    # Results are yielded in the same order as the inputs.
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+class SingleFlightCache():
+    # Thread-safe LRU cache, where only one thread fetches a missing key at a time.
+    # The other threads looking for the same key wait for that fetch, instead of fetching it again.
+    # Marks the keys which could not be fetched, for the waiting threads
+    FAILED = object()
+
+    def __init__(self, max_size=1000000):
+        self.max_size = max_size
+        self.cache = OrderedDict()
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.cache
+
+    def __len__(self):
+        return len(self.cache)
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.put(key, value)
+
+    def update(self, mapping):
+        with self.lock:
+            for key, value in mapping.items():
+                self.put(key, value)
+
+    def put(self, key, value):
+        # Call with the lock held
+        self.cache[key] = value
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+    def get_many(self, keys, fetch_many):
+        # Values of all the keys. The missing ones (which no other thread is fetching)
+        # are fetched at once using `fetch_many(keys)`, which should return a dict.
+        # The keys it leaves out (failed to fetch) are neither cached nor returned, so they are fetched again later
+        values, waiting, to_fetch = {}, {}, []
+        with self.lock:
+            for key in dict.fromkeys(keys):
+                if key in self.cache:
+                    self.cache.move_to_end(key)
+                    values[key] = self.cache[key]
+                elif key in self.in_flight:
+                    waiting[key] = self.in_flight[key]
+                else:
+                    self.in_flight[key] = Future()
+                    to_fetch.append(key)
+
+        if to_fetch:
+            try:
+                fetched = fetch_many(to_fetch)
+            except BaseException as e:
+                with self.lock:
+                    for key in to_fetch:
+                        self.in_flight.pop(key).set_exception(e)
+                raise
+            with self.lock:
+                for key in to_fetch:
+                    if key not in fetched:
+                        self.in_flight.pop(key).set_result(self.FAILED)
+                        continue
+                    values[key] = fetched[key]
+                    self.put(key, values[key])
+                    self.in_flight.pop(key).set_result(values[key])
+
+        for key, future in waiting.items():
+            value = future.result()
+            if value is not self.FAILED:
+                values[key] = value
+        return values
+
+    def get(self, key, fetch):
+        # Value of the key, fetched using `fetch(key)` if missing. Raises KeyError if the fetch failed
+        return self.get_many([key], lambda keys: {key: fetch(key)})[key]
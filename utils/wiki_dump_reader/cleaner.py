@@ -1,10 +1,75 @@
 import re
 
 
+BRACKETS_PATTERNS = {
+    ('[', ']'): re.compile(r'[\[\]]'),
+    ('{', '}'): re.compile(r'[{}]'),
+}
+
+
+def match_brackets(text, open_bracket, close_bracket):
+    """Map the index of each balanced opening bracket to the index next to its closing bracket, in a single pass"""
+    ends, stack = {}, []
+    for match in BRACKETS_PATTERNS[(open_bracket, close_bracket)].finditer(text):
+        index = match.start()
+        if text[index] == open_bracket:
+            stack.append(index)
+        elif stack:
+            ends[stack.pop()] = index + 1
+    return ends
+
+
+class BracketMatcher(object):
+    """Find the end of balanced brackets starting at given indices, which must be queried in increasing order.
+
+    The brackets are scanned only from the queried index. Once an unterminated one is found,
+    all the brackets are paired at once so that the total work stays linear.
+    """
+
+    def __init__(self, text, open_bracket, close_bracket):
+        self.text = text
+        self.open_bracket, self.close_bracket = open_bracket, close_bracket
+        self.pattern = BRACKETS_PATTERNS[(open_bracket, close_bracket)]
+        self.ends = None
+
+    def end_of(self, begin):
+        if self.ends is not None:
+            return self.ends.get(begin)
+        depth = 0
+        for match in self.pattern.finditer(self.text, begin):
+            index = match.start()
+            if self.text[index] == self.open_bracket:
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return index + 1
+        self.ends = match_brackets(self.text, self.open_bracket, self.close_bracket)
+        return self.ends.get(begin)
+
+
 class Cleaner(object):
 
     def __init__(self):
-        pass
+        # Compile all the patterns once, instead of looking them up in the `re` cache for every article
+        self.file_lines_pattern = re.compile(r'^File:.*$', flags=re.MULTILINE)
+        self.external_links_pattern = re.compile(r'\[h[^ ]+ (.*?)\]')
+        self.self_closing_refs_pattern = re.compile(r'<ref[^/]*?/>', flags=re.IGNORECASE | re.DOTALL)
+        self.refs_pattern = re.compile(r'<ref.*?</ref>', flags=re.IGNORECASE | re.DOTALL)
+        self.strong_emphasises_pattern = re.compile(r"'''(.*?)'''", flags=re.DOTALL)
+        self.emphasises_pattern = re.compile(r"''(.*?)''", flags=re.DOTALL)
+        self.comments_pattern = re.compile(r'<!--.*?-->', flags=re.DOTALL)
+        # Same matches as `{{lang(-|\|).*?\|(.*?)}}`, without backtracking over all the later `|`s when `}}` is missing
+        self.langs_pattern = re.compile(r'{{lang(-|\|)[^|]*\|(.*?)}}', flags=re.IGNORECASE | re.DOTALL)
+        self.titles_pattern = re.compile(r'(={2,6})\s*(.*?)\s*\1')
+        self.zh_choices_pattern = re.compile(r'-{.{,100}?zh(-hans|-cn|-hk|):(.{,100}?)(;.{,100}?}-|}-)', flags=re.DOTALL)
+        self.choices_pattern = re.compile(r'-{.{,100}?:(.{,100}?)(;.{,100}?}-|}-)', flags=re.DOTALL)
+        self.plain_choices_pattern = re.compile(r'-{(.{,100}?)}-', flags=re.DOTALL)
+        self.htmls_pattern = re.compile(r'<(.*?)>', flags=re.DOTALL)
+        self.lists_pattern = re.compile(r'^\s*[\*#]\s*', flags=re.MULTILINE)
+        self.indents_pattern = re.compile(r'^\s*[:;]\s*', flags=re.MULTILINE)
+        self.styles_pattern = re.compile(r':?{\| (style|class)=.*?\|}', flags=re.IGNORECASE | re.DOTALL)
+        self.continuous_newlines_pattern = re.compile(r'\n{2,}')
 
     def clean_text(self, text):
         text = self._remove_file_links(text)
@@ -28,7 +93,8 @@ class Cleaner(object):
     def _remove_file_links(self, text):
         """Remove links like `[[File:*]]`"""
         text = self._remove_resource_links(text, 'File')
-        text = re.sub(r'^File:.*$', '', text, flags=re.MULTILINE)
+        if 'File:' in text:
+            text = self.file_lines_pattern.sub('', text)
         return text
 
     def _remove_image_links(self, text):
@@ -41,177 +107,162 @@ class Cleaner(object):
         pattern_begin = text.find(pattern)
         if pattern_begin == -1:
             return text
-        begin, removed = 0, ''
-        while begin < len(text):
-            if pattern_begin > begin:
-                removed += text[begin:pattern_begin]
-            pattern_end, depth = pattern_begin + 2, 2
-            while pattern_end < len(text):
-                ch = text[pattern_end]
-                pattern_end += 1
-                if ch == '[':
-                    depth += 1
-                elif ch == ']':
-                    depth -= 1
-                    if depth == 0:
-                        break
-            if depth == 0:
-                begin = pattern_end
-            else:
-                removed += text[begin]
-                begin += 1
+        link_ends = BracketMatcher(text, '[', ']')
+        begin, removed = 0, []
+        while pattern_begin != -1:
+            pattern_end = link_ends.end_of(pattern_begin)
+            if pattern_end is None:
+                # Unterminated link, retain it as it is
+                pattern_begin = text.find(pattern, pattern_begin + 1)
+                continue
+            removed.append(text[begin:pattern_begin])
+            begin = pattern_end
             pattern_begin = text.find(pattern, begin)
-            if pattern_begin == -1:
-                break
-        if len(text) > begin:
-            removed += text[begin:]
-        return removed
+        removed.append(text[begin:])
+        return ''.join(removed)
 
     def _remove_external_links(self, text):
         """Remove links like [*]"""
-        return re.sub(r'\[h[^ ]+ (.*?)\]', r'\1', text)
+        if '[h' not in text:
+            return text
+        return self.external_links_pattern.sub(r'\1', text)
 
     def _remove_refs(self, text):
         """Remove patterns like <ref*>*</ref>"""
-        text = re.sub(r'<ref[^/]*?/>', '', text, flags=re.IGNORECASE | re.DOTALL)
-        text = re.sub(r'<ref.*?</ref>', '', text, flags=re.IGNORECASE | re.DOTALL)
+        if '<' not in text:
+            return text
+        text = self.self_closing_refs_pattern.sub('', text)
+        text = self.refs_pattern.sub('', text)
         # text = re.sub(r'{{Refbegin.*?Refend}}', '', text, flags=re.IGNORECASE | re.DOTALL)
         return text
 
     def _remove_emphasises(self, text):
         """Remove patterns like '''*'''"""
-        text = re.sub(r"'''(.*?)'''", r'\1', text, flags=re.DOTALL)
-        text = re.sub(r"''(.*?)''", r'\1', text, flags=re.DOTALL)
+        if "''" not in text:
+            return text
+        text = self.strong_emphasises_pattern.sub(r'\1', text)
+        text = self.emphasises_pattern.sub(r'\1', text)
         return text
 
     def _remove_comments(self, text):
         """Remove patterns like <!--*-->"""
-        return re.sub(r'<!--.*?-->', '', text, flags=re.DOTALL)
+        if '<!--' not in text:
+            return text
+        return self.comments_pattern.sub('', text)
 
     def _remove_langs(self, text):
         """Remove pattenrs like {{lang-*|*}}}"""
-        return re.sub(r'{{lang(-|\|).*?\|(.*?)}}', r'\2', text, flags=re.IGNORECASE | re.DOTALL)
+        if '{{' not in text:
+            return text
+        return self.langs_pattern.sub(r'\2', text)
 
     def _remove_titles(self, text):
         """Remove patterns like ==*=="""
-        return re.sub(r'(={2,6})\s*(.*?)\s*\1', r'\2', text)
+        return self.titles_pattern.sub(r'\2', text)
 
     def _remove_choices(self, text):
         """Remove patterns like -{zh-hans:*; zh-hant:*}-"""
-        text = re.sub(
-            r'-{.{,100}?zh(-hans|-cn|-hk|):(.{,100}?)(;.{,100}?}-|}-)',
-            r'\2', text,
-            flags=re.DOTALL
-        )
-        text = re.sub(r'-{.{,100}?:(.{,100}?)(;.{,100}?}-|}-)', r'\1', text, flags=re.DOTALL)
-        text = re.sub(r'-{(.{,100}?)}-', r'\1', text, flags=re.DOTALL)
+        if '-{' not in text:
+            return text
+        text = self.zh_choices_pattern.sub(r'\2', text)
+        text = self.choices_pattern.sub(r'\1', text)
+        text = self.plain_choices_pattern.sub(r'\1', text)
         return text
 
     def _remove_templates(self, text):
         """Remove patterns like {{*}}"""
-        begin, removed = 0, ''
-        while begin < len(text):
-            pattern_begin = text.find('{{', begin)
-            if pattern_begin == -1:
-                if begin == 0:
-                    removed = text
-                else:
-                    removed += text[begin:]
-                break
-            if pattern_begin > begin:
-                removed += text[begin:pattern_begin]
-            pattern_end, depth = pattern_begin + 2, 2
-            while pattern_end < len(text):
-                ch = text[pattern_end]
-                pattern_end += 1
-                if ch == '{':
-                    depth += 1
-                elif ch == '}':
-                    depth -= 1
-                    if depth == 0:
-                        link = text[pattern_begin + 2:pattern_end - 2]
-                        parts = link.split('|')
-                        template_type = parts[0].split(' ')[0].lower()
-                        if len(parts) == 1:
-                            if all(map(lambda x: x in {'"', "'", ' '}, parts[0][:])):
-                                removed += parts[0].replace(' ', '')
-                        elif len(parts) in [2, 3]:
-                            if template_type in {'le'} or template_type.startswith('link-'):
-                                removed += parts[1]
-                        break
+        pattern_begin = text.find('{{')
+        if pattern_begin == -1:
+            return text
+        template_ends = BracketMatcher(text, '{', '}')
+        begin, removed = 0, []
+        while pattern_begin != -1:
+            removed.append(text[begin:pattern_begin])
+            pattern_end = template_ends.end_of(pattern_begin)
+            if pattern_end is None:
+                # Unterminated template, drop everything after it
+                return ''.join(removed)
+            link = text[pattern_begin + 2:pattern_end - 2]
+            parts = link.split('|')
+            template_type = parts[0].split(' ')[0].lower()
+            if len(parts) == 1:
+                if all(map(lambda x: x in {'"', "'", ' '}, parts[0][:])):
+                    removed.append(parts[0].replace(' ', ''))
+            elif len(parts) in [2, 3]:
+                if template_type in {'le'} or template_type.startswith('link-'):
+                    removed.append(parts[1])
             begin = pattern_end
-        return removed
+            pattern_begin = text.find('{{', begin)
+        removed.append(text[begin:])
+        return ''.join(removed)
 
     def _remove_htmls(self, text):
-        return re.sub(r'<(.*?)>', '', text, flags=re.DOTALL)
+        if '<' not in text:
+            return text
+        return self.htmls_pattern.sub('', text)
 
     def _remove_lists(self, text):
-        return re.sub(r'^\s*[\*#]\s*', '', text, flags=re.MULTILINE)
+        if '*' not in text and '#' not in text:
+            return text
+        return self.lists_pattern.sub('', text)
 
     def _remove_indents(self, text):
-        return re.sub(r'^\s*[:;]\s*', '', text, flags=re.MULTILINE)
+        if ':' not in text and ';' not in text:
+            return text
+        return self.indents_pattern.sub('', text)
 
     def _remove_styles(self, text):
-        return re.sub(r':?{\| (style|class)=.*?\|}', '', text, flags=re.IGNORECASE | re.DOTALL)
+        if '{|' not in text:
+            return text
+        return self.styles_pattern.sub('', text)
 
     def _remove_spaces(self, text):
         return text.replace('\u200b', '')
 
     def _remove_continuous_newlines(self, text):
-        return re.sub(r'\n{2,}', '\n', text)
+        if '\n\n' not in text:
+            return text
+        return self.continuous_newlines_pattern.sub('\n', text)
 
     def build_links(self, text):
-        begin, removed, links = 0, '', []
-        while begin < len(text):
-            pattern_begin = text.find('[[', begin)
-            if pattern_begin == -1:
-                if begin == 0:
-                    removed = text
-                else:
-                    removed += text[begin:]
-                break
+        pattern_begin = text.find('[[')
+        if pattern_begin == -1:
+            return text.rstrip(), []
+        link_ends = BracketMatcher(text, '[', ']')
+        begin, removed, removed_len, links = 0, [], 0, []
+        while pattern_begin != -1:
             if pattern_begin > begin:
-                if removed:
-                    removed += text[begin:pattern_begin]
-                else:
-                    removed = text[begin:pattern_begin].lstrip()
-            pattern_end, depth = pattern_begin + 2, 2
-            while pattern_end < len(text):
-                ch = text[pattern_end]
-                pattern_end += 1
-                if ch == '[':
-                    depth += 1
-                elif ch == ']':
-                    depth -= 1
-                    if depth == 0:
-                        link = text[pattern_begin + 2:pattern_end - 2]
-                        parts = link.split('|')
-                        if len(parts) == 1:
-                            if ':' in link:
-                                pure = link.split(':')[-1]
-                                links.append({
-                                    'begin': len(removed),
-                                    'end': len(removed) + len(pure),
-                                    'link': link,
-                                    'text': pure
-                                })
-                                removed += pure
-                            else:
-                                links.append({
-                                    'begin': len(removed),
-                                    'end': len(removed) + len(link),
-                                    'link': link,
-                                    'text': link
-                                })
-                                removed += link
-                        elif len(parts) == 2:
-                            links.append({
-                                'begin': len(removed),
-                                'end': len(removed) + len(parts[1]),
-                                'link': parts[0],
-                                'text': parts[1]
-                            })
-                            removed += parts[1]
-                        break
+                segment = text[begin:pattern_begin]
+                if not removed_len:
+                    segment = segment.lstrip()
+                removed.append(segment)
+                removed_len += len(segment)
+            pattern_end = link_ends.end_of(pattern_begin)
+            if pattern_end is None:
+                # Unterminated link, drop everything after it
+                return ''.join(removed).rstrip(), links
+            link = text[pattern_begin + 2:pattern_end - 2]
+            parts = link.split('|')
+            if len(parts) == 1:
+                pure = link.split(':')[-1] if ':' in link else link
+                links.append({
+                    'begin': removed_len,
+                    'end': removed_len + len(pure),
+                    'link': link,
+                    'text': pure
+                })
+                removed.append(pure)
+                removed_len += len(pure)
+            elif len(parts) == 2:
+                links.append({
+                    'begin': removed_len,
+                    'end': removed_len + len(parts[1]),
+                    'link': parts[0],
+                    'text': parts[1]
+                })
+                removed.append(parts[1])
+                removed_len += len(parts[1])
             begin = pattern_end
-        return removed.rstrip(), links
+            pattern_begin = text.find('[[', begin)
+        removed.append(text[begin:])
+        return ''.join(removed).rstrip(), links
@@ -1,35 +1,135 @@
-import codecs
+import bz2
+import gzip
+import lzma
+from collections import deque
+from multiprocessing import Pool
 from xml.etree import ElementTree
 
+# Compressed dumps are decoded on the fly, no need to extract them first
+COMPRESSED_OPENERS = {
+    '.bz2': bz2.open,
+    '.gz': gzip.open,
+    '.xz': lzma.open,
+}
 
-def iterate(file_path):
-    with codecs.open(file_path, 'r', 'utf8') as reader:
-        content = None
+
+# Bytes fed to the XML parser at once
+READ_CHUNK_SIZE = 1 << 20
+
+
+def open_dump(file_path, binary=False):
+    mode = 'rb' if binary else 'rt'
+    encoding = None if binary else 'utf8'
+    for extension, opener in COMPRESSED_OPENERS.items():
+        if file_path.endswith(extension):
+            return opener(file_path, mode, encoding=encoding)
+    return open(file_path, mode, encoding=encoding)
+
+
+def read_stream_offsets(index_path):
+    """Get the sorted byte offsets of the bz2 streams from a multistream index (`offset:page_id:title`)"""
+    offsets = set()
+    with open_dump(index_path) as reader:
         for line in reader:
-            line = line.strip()
-            if line == '<page>':
-                content = [line]
-            elif line == '</page>':
-                content.append(line)
-                content = '\n'.join(content)
-                tree = ElementTree.fromstring(content)
-                content = None
-                ns_elem = tree.find('ns')
-                if ns_elem is None:
-                    continue
-                if ns_elem.text.strip() != '0':
-                    continue
-                title_elem = tree.find('title')
-                if title_elem is None:
-                    continue
-                title = title_elem.text
-                text_elem = tree.find('revision/text')
-                if text_elem is None:
-                    continue
-                text = text_elem.text
-                if text is None:
-                    continue
-                yield title, text
-            else:
-                if type(content) is list:
-                    content.append(line)
+            offset = line.split(':', 1)[0]
+            if offset.isdigit():
+                offsets.add(int(offset))
+    return sorted(offsets)
+
+
+def _decompress_stream(args):
+    file_path, begin, end = args
+    with open(file_path, 'rb') as f:
+        f.seek(begin)
+        data = f.read(end - begin if end is not None else -1)
+    return bz2.decompress(data)
+
+
+def _iterate_multistream(file_path, index_path, num_workers):
+    # The 1st stream (before the 1st indexed offset) has the siteinfo header
+    # and the last one runs till EOF with the closing </mediawiki>
+    offsets = [0] + [offset for offset in read_stream_offsets(index_path) if offset > 0]
+    streams = [(file_path, begin, end) for begin, end in zip(offsets, offsets[1:] + [None])]
+    # Keep only a bounded no. of decompressed streams in memory
+    max_pending = 4 * num_workers
+    with Pool(num_workers) as pool:
+        pending = deque()
+        for stream in streams:
+            pending.append(pool.apply_async(_decompress_stream, (stream,)))
+            if len(pending) >= max_pending:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def _iterate_file(file_path):
+    with open_dump(file_path, binary=True) as reader:
+        while True:
+            chunk = reader.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+class _PageCollector(object):
+    """Parser target which keeps only the title & text of pages in the main namespace, without building any tree"""
+
+    FIELDS = {'title', 'ns', 'text'}
+
+    def __init__(self):
+        self.pages = []
+        self._reset()
+
+    def _reset(self):
+        self.title, self.ns, self.text = None, None, None
+        self._field, self._buffer = None, []
+
+    def start(self, tag, attrib):
+        tag = tag.rpartition('}')[2]
+        if tag == 'page':
+            self._reset()
+        elif tag in self.FIELDS:
+            # `ns` comes before the revision, so text of other namespaces is never collected
+            if tag == 'text' and (self.ns is None or self.ns.strip() != '0'):
+                return
+            self._field, self._buffer = tag, []
+
+    def data(self, data):
+        if self._field is not None:
+            self._buffer.append(data)
+
+    def end(self, tag):
+        tag = tag.rpartition('}')[2]
+        if tag == self._field:
+            setattr(self, tag, ''.join(self._buffer) if self._buffer else None)
+            self._field, self._buffer = None, []
+        elif tag == 'page':
+            if self.ns is not None and self.ns.strip() == '0' and self.title is not None and self.text is not None:
+                self.pages.append((self.title, self.text))
+            self._reset()
+
+    def close(self):
+        return None
+
+
+def _iterate_pages(chunks):
+    collector = _PageCollector()
+    parser = ElementTree.XMLParser(target=collector)
+    for chunk in chunks:
+        parser.feed(chunk)
+        if collector.pages:
+            yield from collector.pages
+            collector.pages = []
+    parser.close()
+    yield from collector.pages
+
+
+def iterate(file_path, index_path=None, num_workers=4):
+    """Iterate over (title, text) of all articles in a XML dump (plain, .bz2, .gz or .xz).
+
+    If the multistream `index_path` is given for a .bz2 dump, the streams are decompressed in parallel.
+    """
+    if index_path and file_path.endswith('.bz2'):
+        yield from _iterate_pages(_iterate_multistream(file_path, index_path, num_workers))
+    else:
+        yield from _iterate_pages(_iterate_file(file_path))